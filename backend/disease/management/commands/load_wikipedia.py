@@ -4,6 +4,7 @@ from bs4 import BeautifulSoup
 from typing import List, Tuple, Union
 
 from django.core.cache import cache
+from util.cache_keys import WIKI, bump_dataset_version
 from wiki.query import *
 import wiki.business as business
 
@@ -24,6 +25,8 @@ class Command(BaseCommand):
                 except Exception as e:
                     print(f"type({e}) - {e}")
 
+        bump_dataset_version(WIKI)
+
 
 # This is the "main" function per file
 def process_file(fpath) -> None:
@@ -0,0 +1,43 @@
+import numpy as np
+from typing import List, Tuple
+
+"""
+    Helpers for storing life tables as packed arrays, indexed by age.
+"""
+
+# Ages 0-109, plus the open age interval 110+
+AGE_COUNT = 111
+# Packed arrays are little endian float32, regardless of the platform writing them
+PACKED_DTYPE = np.dtype("<f4")
+
+
+def pack_floats(values: np.ndarray) -> bytes:
+    return np.ascontiguousarray(values, dtype=PACKED_DTYPE).tobytes()
+
+
+def unpack_floats(data: bytes) -> np.ndarray:
+    """Returns a read-only array backed by `data`, without copying it"""
+    return np.frombuffer(data, dtype=PACKED_DTYPE)
+
+
+def to_age_grid(years: np.ndarray, ages: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scatters (year, age, value) rows into one dense row per year
+    :return: (sorted unique years, grid of shape (len(years), AGE_COUNT)). Cells without a row are NaN
+    """
+    unique_years, year_index = np.unique(years, return_inverse=True)
+    grid = np.full((len(unique_years), AGE_COUNT), np.nan, dtype=PACKED_DTYPE)
+    grid[year_index, ages] = values
+    return unique_years, grid
+
+
+def pack_by_year(
+    years: np.ndarray, ages: np.ndarray, probability: np.ndarray, cumulative_probability: np.ndarray
+) -> List[Tuple[int, bytes, bytes]]:
+    """
+    Packs the rows of one (country, sex) slice into one entry per year
+    :return: list of (year, packed probability, packed cumulative_probability)
+    """
+    unique_years, probability_grid = to_age_grid(years, ages, probability)
+    _, cumulative_grid = to_age_grid(years, ages, cumulative_probability)
+    return [(int(year), pack_floats(probability_grid[i]), pack_floats(cumulative_grid[i])) for i, year in enumerate(unique_years)]
@@ -0,0 +1,164 @@
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+
+from hmd.arrays import AGE_COUNT, PACKED_DTYPE
+from hmd.query import get_availability, get_country_id, get_summaries
+from hmd.serializers import serialize, serialize_life_tables, serialize_matrix, to_json_list
+from hmd.statistics import compare_pairwise
+from hmd.store import SURFACE_COLUMNS, get_store
+from util.decorators import read_through
+from util.responses import Payload, make_payload
+
+# Most life tables one batch request may ask for
+MAX_BATCH_SIZE = 100
+# Most countries one comparison may ask for
+MAX_COMPARISON_SIZE = 10
+# Life table shown when the life tables page opens: the most recent one of this country and sex, if there is one
+DEFAULT_COUNTRY = "Sweden"
+DEFAULT_SEX = "f"
+
+
+@read_through("lifetables_countries")
+def get_countries() -> Payload:
+    return make_payload(serialize(get_store().get_countries()))
+
+
+@read_through("lifetable_years")
+def get_lifetable_years(country: str) -> Payload:
+    return make_payload(serialize(get_store().get_years(country)))
+
+
+@read_through("lifetable_availability")
+def get_lifetable_availability() -> Payload:
+    return make_payload(serialize(get_availability()))
+
+
+@read_through("lifetables")
+def get_life_table(country: str, sex: str, year: int) -> Payload:
+    """
+    Returns one life table. Its body is pre-rendered in the store, so this is cached for its compressed encodings
+    """
+    return make_payload(get_store().get_payload(country, sex, year) or serialize([]))
+
+
+@read_through("lifetables_batch")
+def get_life_tables(keys: Tuple[Tuple[str, str, int], ...]) -> Payload:
+    """
+    Returns many life tables in one body, in the order of `keys`. Every table is pre-rendered in the store, so this
+    is one lookup per key, with no query and nothing to serialize but the keys themselves. There are too many batches
+    to pre-render, so the body is compressed at the fast levels
+    :param keys: (country, sex, year)
+    """
+    store = get_store()
+    body = serialize_life_tables([(country, sex, year, store.get_payload(country, sex, year)) for country, sex, year in keys])
+    return make_payload(body, fast=True)
+
+
+def get_surface(country: str, sex: str, column: str) -> Tuple[Optional[int], np.ndarray]:
+    """Returns (first year, (years, ages) matrix) of the Lexis surface, with an empty matrix if there is no table"""
+    surface = get_store().get_surface(country, sex, column)
+    return surface if surface is not None else (None, np.empty((0, AGE_COUNT - 1), dtype=PACKED_DTYPE))
+
+
+@read_through("lexis_surface")
+def get_lexis_surface(country: str, sex: str, column: str) -> Payload:
+    """
+    Renders the Lexis surface as JSON: {country, sex, column, first_year, shape: [years, ages], values}, where values
+    is the matrix as one flat row-major list, with null where there is no value
+    """
+    first_year, values = get_surface(country, sex, column)
+    head = serialize({"country": country, "sex": sex, "column": column, "first_year": first_year, "shape": list(values.shape)})
+    return make_payload(head[:-1] + b',"values":' + serialize_matrix(values) + b"}")
+
+
+def get_lexis_surface_binary(country: str, sex: str, column: str) -> Tuple[Payload, Optional[int], Tuple[int, int]]:
+    """
+    Renders the Lexis surface as little-endian float32, row-major, with NaN where there is no value. The body is a
+    straight copy of the store's matrix, so it isn't worth caching (nor compressing on every request)
+    :return: (payload, first year, shape)
+    """
+    first_year, values = get_surface(country, sex, column)
+    return make_payload(values.astype(PACKED_DTYPE).tobytes(), compressed=False), first_year, values.shape
+
+
+@read_through("lifetable_summaries")
+def get_lifetable_summaries(country: Optional[str], year: Optional[int], sex: Optional[str]) -> Payload:
+    """Summaries of every life table of a country, of every country in a year, or of one country in a year"""
+    filters = {key: value for key, value in [("year", year), ("sex", sex)] if value is not None}
+    if country is not None:
+        filters["country_id"] = get_country_id(country)
+        if filters["country_id"] is None:
+            return make_payload(serialize([]))
+    return make_payload(serialize(get_summaries(**filters)))
+
+
+@read_through("lifetable_comparison")
+def get_comparison(countries: Tuple[str, ...], sex: str, year: int, column: str, measure: str) -> Payload:
+    """
+    Compares one column of the life tables of many countries in a year, at every age, pair by pair. Callers should
+    canonicalize `countries` (sorted, without duplicates) so that equal comparisons share a cache entry. Like batches,
+    comparisons are compressed at the fast levels
+    :return: JSON {year, sex, column, measure, countries (those with a table), missing (those without), curves (one list
+    by age per country), comparisons: [{countries: [a, b], values (a - b or a / b, by age)}]}
+    """
+    found, curves = get_store().get_curves(list(countries), sex, year, column)
+    pairs, values = compare_pairwise(curves, measure)
+    data = {
+        "year": year,
+        "sex": sex,
+        "column": column,
+        "measure": measure,
+        "countries": found,
+        "missing": [country for country in countries if country not in found],
+        "curves": to_json_list(curves),
+        "comparisons": [{"countries": [found[i], found[j]], "values": row} for (i, j), row in zip(pairs.tolist(), to_json_list(values))],
+    }
+    return make_payload(serialize(data), fast=True)
+
+
+@read_through("lifetables_bootstrap")
+def get_bootstrap() -> Payload:
+    """
+    Everything the life tables page needs to render, in one body
+    :return: JSON {countries: [{id, name, years: {sex: years, most recent first}}], default: {country, sex, year,
+    table} or null if there is no table at all}
+    """
+    store = get_store()
+    countries = [dict(country, years=store.get_years_by_sex(country["name"])) for country in store.get_countries()]
+
+    # The default country, or else the first one with a table of the default sex
+    candidates = [country for country in countries if country["name"] == DEFAULT_COUNTRY] + countries
+    default = next((country for country in candidates if country["years"].get(DEFAULT_SEX)), None)
+    if default is None:
+        return make_payload(serialize({"countries": countries, "default": None}))
+
+    year = default["years"][DEFAULT_SEX][0]
+    table = serialize_life_tables([(default["name"], DEFAULT_SEX, year, store.get_payload(default["name"], DEFAULT_SEX, year))])
+    return make_payload(serialize({"countries": countries})[:-1] + b',"default":' + table[1:-1] + b"}")
+
+
+def get_warm_tasks() -> List[Tuple[Callable, dict]]:
+    """
+    Lists the cached hmd responses worth computing before anyone asks for them: every country, year and sex variant
+    of the endpoints the pages call. Comparisons are left out, as there are too many country sets to enumerate
+    :return: list of (read_through function, parameters)
+    """
+    store = get_store()
+    countries = [name for _, name in store.countries]
+    years = (np.flatnonzero(store.available.any(axis=(0, 1))) + store.first_year).tolist()
+
+    tasks: List[Tuple[Callable, dict]] = [(get_countries, {}), (get_lifetable_availability, {}), (get_bootstrap, {})]
+    tasks += [(get_lifetable_years, {"country": country}) for country in countries]
+    tasks += [
+        (get_life_table, {"country": store.countries[c][1], "sex": store.sexes[s], "year": store.first_year + int(y)})
+        for c, s, y in zip(*store.available.nonzero())
+    ]
+    tasks += [
+        (get_lexis_surface, {"country": country, "sex": sex, "column": column})
+        for country in countries
+        for sex in store.sexes
+        for column in SURFACE_COLUMNS
+    ]
+    tasks += [(get_lifetable_summaries, {"country": country, "year": None, "sex": None}) for country in countries]
+    tasks += [(get_lifetable_summaries, {"country": None, "year": year, "sex": None}) for year in years]
+    return tasks
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from hmd.models import *
+from hmd.query import get_country_id, get_life_table_rows
+
+import time
+from typing import Callable
+
+
+class Command(BaseCommand):
+    help = "Compares the EXPLAIN plan and timing of the life table query, joined on country name (before) vs filtered by country id (after)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--country", help="Country name. Defaults to the country of the first life table row")
+        parser.add_argument("--sex", default="f")
+        parser.add_argument("--year", type=int, help="Defaults to the year of the first life table row")
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        first = LifeTable.objects.select_related("country").order_by("id").first()
+        if not first:
+            raise CommandError("No life tables loaded. Run load_lifetables first")
+
+        country = options["country"] or first.country.name
+        year = options["year"] or first.year
+        sex = options["sex"]
+        country_id = get_country_id(country)
+        if not country_id:
+            raise CommandError(f"Unknown country `{country}`")
+
+        def before():
+            return (
+                LifeTable.objects.filter(country__name=country, year=year, sex=sex, age__lte=109)
+                .order_by("age")
+                .values("age", "probability", "cumulative_probability")
+            )
+
+        def after():
+            return get_life_table_rows(get_country_id(country), sex, year)
+
+        self.stdout.write(f"Life table for {country} ({sex}) {year}, {options['iterations']} iterations each")
+        self.report("Before: join on country name", before, options["iterations"])
+        self.report("After: filter on country id", after, options["iterations"])
+
+    def report(self, label: str, make_queryset: Callable, iterations: int):
+        # ANALYZE runs the query, which only postgres supports as an explain option
+        explain_options = {"analyze": True} if connection.vendor == "postgresql" else {}
+        self.stdout.write(f"\n=== {label}")
+        self.stdout.write(make_queryset().explain(**explain_options))
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            list(make_queryset())
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Mean: {1000 * elapsed / iterations:.3f} ms per query")
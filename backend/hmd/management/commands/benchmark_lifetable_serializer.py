@@ -0,0 +1,42 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+from hmd.serializers import json_response, serialize_life_table
+from hmd.store import get_store
+
+import timeit
+
+
+class Command(BaseCommand):
+    help = "Compares serializing a life table through JsonResponse with Decimal rows (before) against hmd.serializers (after)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        store = get_store()
+        if not store.available.any():
+            raise CommandError("No life tables loaded. Run load_lifetables first")
+
+        country_index, sex_index, year_offset = [int(x[0]) for x in store.available.nonzero()]
+        country = store.countries[country_index][1]
+        sex = store.sexes[sex_index]
+        year = store.first_year + year_offset
+        probability, cumulative = store.get_table(country, sex, year)
+
+        # The rows LifeTable.objects.values() used to return
+        decimal_rows = [
+            {"age": age, "probability": Decimal(f"{qx:.5f}"), "cumulative_probability": Decimal(f"{lx:.5f}")}
+            for age, qx, lx in zip(range(len(probability) - 1), probability.tolist(), cumulative.tolist())
+            if qx == qx
+        ]
+
+        iterations = options["iterations"]
+        before = timeit.timeit(lambda: JsonResponse(decimal_rows, safe=False), number=iterations)
+        after = timeit.timeit(lambda: json_response(serialize_life_table(probability, cumulative)), number=iterations)
+
+        self.stdout.write(f"Life table for {country} ({sex}) {year}, {iterations} iterations each")
+        self.stdout.write(f"Before: JsonResponse with Decimals  {1e6 * before / iterations:8.1f} µs per response")
+        self.stdout.write(f"After:  hmd.serializers             {1e6 * after / iterations:8.1f} µs per response")
+        self.stdout.write(f"Speedup: {before / after:.1f}x")
@@ -1,14 +1,25 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from hmd.models import *
+from hmd.arrays import pack_by_year, to_age_grid
+from hmd.parser import parse_hmd_text, parse_hmd_title
+from hmd.statistics import summarize_by_year
+from util.processes import fork_pool
 
 import os
+import time
+import hashlib
+import numpy as np
+from concurrent.futures import as_completed
 from typing import List, Tuple
 
 FILE_NAMES = ["fltper_1x1.txt", "mltper_1x1.txt"]
 
-
-def extract_row(text: str) -> list:
-    return [x for x in text.split(" ") if x]
+# Rows are buffered and written with one INSERT ... ON CONFLICT statement per batch
+BATCH_SIZE = 5000
+UNIQUE_FIELDS = ["country", "sex", "year", "age"]
+UPDATE_FIELDS = ["probability", "cumulative_probability"]
 
 
 def get_sex(text: str) -> str:
@@ -19,67 +30,199 @@ def get_sex(text: str) -> str:
         return "m"
 
 
-class Command(BaseCommand):
-    help = "Loads HMD life tables into database. Calculates cumulative along the way"
-
-    def handle(self, *args, **options):
-        path = os.path.join("data", "hmd_countries")  # Next is country, then 'STATS', then FILE_NAME
-        folders = os.listdir(path)
-        for folder in folders:
-            for file_name in FILE_NAMES:
-                file_path = os.path.join(path, folder, "STATS", file_name)
-
-                if os.path.isfile(file_path):
-                    try:
-                        self.process_life_table(file_path, str(folder))
-                    except Exception as e:
-                        print(f"type({e}) - {e}")
+def load_country(path: str, short_name: str, batch_size: int = BATCH_SIZE, force: bool = False) -> Tuple[str, int, int, float]:
+    """
+    Loads every changed life table file of one HMD country folder
+    :param path: path to the folder containing all countries
+    :param short_name: HMD country code, which is also the name of the country's folder
+    :param batch_size: Number of rows written per upsert statement
+    :param force: Whether to reload files that are unchanged since they were last loaded
+    :return: (short_name, rows written, files skipped as unchanged, seconds taken)
+    """
+    start = time.perf_counter()
+    loader = LifeTableLoader(batch_size, force)
+    for file_name in FILE_NAMES:
+        file_path = os.path.join(path, short_name, "STATS", file_name)
+
+        if os.path.isfile(file_path):
+            try:
+                loader.process_life_table(file_path, short_name)
+            except Exception as e:
+                loader.buffer = []
+                print(f"type({e}) - {e}")
+
+    return short_name, loader.rows_written, loader.files_skipped, time.perf_counter() - start
+
+
+class LifeTableLoader:
+    """
+    Parses HMD life table files, and upserts their rows in batches.
+    Files are tracked in the LifeTableSource manifest, and skipped if their contents haven't changed
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, force: bool = False):
+        self.batch_size = batch_size
+        self.force = force
+        self.buffer: List[LifeTable] = []
+        self.rows_written = 0
+        self.files_skipped = 0
 
     def process_life_table(self, path, short_name: str):
-        with open(path, "r") as file:
-            rows = file.readlines()
-            country_name = rows[0].split(",")[0]
-            country = self.ensure_country(country_name, short_name)
-            sex = get_sex(path)
-
-            for row_text in rows[4:]:
-                row = extract_row(row_text)
-                year = row[0]
-                age = row[1]
-
-                probability = row[3]
-                if probability == ".":
-                    probability = 100
-
-                if row[5] == ".":
-                    p_alive = 0
-                else:
-                    p_alive = int(row[5]) / 100000
-
-                if "+" in age:
-                    age = age[0:-1]
-
+        with open(path, "rb") as file:
+            content = file.read()
+
+        text = content.decode()
+        # Also done for unchanged files, so a country picks up its name from its title even if no file is reloaded
+        country = self.ensure_country(parse_hmd_title(text.split("\n", 1)[0])[0], short_name)
+
+        checksum = hashlib.sha256(content).hexdigest()
+        source_path = os.path.join(short_name, "STATS", os.path.basename(path))
+        if not self.force and LifeTableSource.objects.filter(path=source_path, checksum=checksum).exists():
+            self.files_skipped += 1
+            return
+
+        table = parse_hmd_text(text)
+        sex = get_sex(path)
+
+        # Missing qx is stored as 100, and missing lx as nobody left alive
+        probability = np.nan_to_num(table.columns["qx"], nan=100)
+        p_alive = np.nan_to_num(table.columns["lx"], nan=0) / 100000
+
+        # The (country, sex) slice is replaced as a whole, so rows dropped from the file don't linger
+        with transaction.atomic():
+            LifeTable.objects.filter(country=country, sex=sex).delete()
+            CompactLifeTable.objects.filter(country=country, sex=sex).delete()
+            LifeTableAvailability.objects.filter(country=country, sex=sex).delete()
+            LifeTableSummary.objects.filter(country=country, sex=sex).delete()
+
+            for year, age, qx, lx in zip(table.year.tolist(), table.age.tolist(), probability.tolist(), p_alive.tolist()):
                 params = {
                     "country": country,
                     "sex": sex,
                     "year": year,
                     "age": age,
-                    "probability": probability,
-                    "cumulative_probability": p_alive,
+                    "probability": qx,
+                    "cumulative_probability": lx,
                 }
 
                 self.ensure_life_table_entry(params)
 
+            # Each file is flushed on its own, so a bad file can't poison rows buffered from the next one
+            self.flush()
+
+            tables = pack_by_year(table.year, table.age, probability, p_alive)
+            CompactLifeTable.objects.bulk_create(
+                [CompactLifeTable(country=country, sex=sex, year=year, probability=p, cumulative_probability=c) for year, p, c in tables],
+                batch_size=self.batch_size,
+            )
+
+            years = [year for year, _, _ in tables]
+            if years:
+                LifeTableAvailability.objects.create(country=country, sex=sex, min_year=years[0], max_year=years[-1], years=years)
+
+            # Every year of the file is summarized in one vectorized pass, with the file's own ax and ex
+            grid_years, probability_grid = to_age_grid(table.year, table.age, probability)
+            separation, life_expectancy = (
+                to_age_grid(table.year, table.age, table.columns[name])[1] if name in table.columns else None for name in ("ax", "ex")
+            )
+            summaries = summarize_by_year(grid_years, probability_grid, separation, life_expectancy)
+            LifeTableSummary.objects.bulk_create(
+                [LifeTableSummary(country=country, sex=sex, **fields) for fields in summaries],
+                batch_size=self.batch_size,
+            )
+
+            LifeTableSource.objects.update_or_create(
+                path=source_path,
+                defaults={"country": country, "sex": sex, "checksum": checksum, "row_count": len(table)},
+            )
+
     @staticmethod
     def ensure_country(country: str, short: str) -> Country:
-        res, _ = Country.objects.get_or_create(name=country, short_name=short)
+        """
+        Countries are keyed on their folder code, not their name, so folders sharing a title never share life tables.
+        Names are unique too, as the API addresses countries by name: a folder titled like another one fails to load,
+        rather than shadowing it
+        :param country: name, as read from the title of the country's files
+        :param short: HMD country code, which is also the name of the country's folder
+        """
+        res, created = Country.objects.get_or_create(short_name=short, defaults={"name": country})
+        if not created and res.name != country:
+            res.name = country
+            res.save(update_fields=["name"])
         return res
 
-    @staticmethod
-    def ensure_life_table_entry(params: dict):
+    def ensure_life_table_entry(self, params: dict):
         """
-        Takes: country,sex,age,year,probability,cumulative_probability
-        :param params: dict with the above keys
+        Buffers a life table row, writing the buffer once it reaches the batch size
+        :param params: dict with keys country,sex,age,year,probability,cumulative_probability
         :return: None
         """
-        LifeTable.objects.get_or_create(**params)
+        self.buffer.append(LifeTable(**params))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Upserts all buffered rows, keyed on (country, sex, year, age), so reruns update values in place"""
+        if not self.buffer:
+            return
+        LifeTable.objects.bulk_create(
+            self.buffer,
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=UNIQUE_FIELDS,
+            update_fields=UPDATE_FIELDS,
+        )
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+
+class Command(BaseCommand):
+    help = "Loads HMD life tables into database. Calculates cumulative along the way"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Number of rows written per upsert statement")
+        parser.add_argument("--workers", type=int, default=1, help="Number of processes loading countries in parallel")
+        parser.add_argument("--force", action="store_true", help="Reload every file, even those unchanged since the last load")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        workers = options["workers"]
+        force = options["force"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+
+        start = time.perf_counter()
+        path = os.path.join("data", "hmd_countries")  # Next is country, then 'STATS', then FILE_NAME
+        folders = [str(folder) for folder in os.listdir(path)]
+
+        if workers == 1:
+            results = [load_country(path, folder, batch_size, force) for folder in folders]
+        else:
+            results = self.load_in_parallel(path, folders, batch_size, workers, force)
+
+        self.print_summary(results, time.perf_counter() - start)
+        # Web processes map the new snapshot on their next stat of it (see hmd.store). This process reloads nothing, and
+        # cached responses need no invalidation: their keys hold the version of the store they were computed from
+        call_command("write_lifetable_snapshot")
+
+    @staticmethod
+    def load_in_parallel(path: str, folders: List[str], batch_size: int, workers: int, force: bool) -> List[Tuple[str, int, int, float]]:
+        """Fans countries out to a process pool. Each worker parses and writes its own countries"""
+        results = []
+        with fork_pool(workers) as pool:
+            futures = [pool.submit(load_country, path, folder, batch_size, force) for folder in folders]
+            for future in as_completed(futures):
+                results.append(future.result())
+        return results
+
+    def print_summary(self, results: List[Tuple[str, int, int, float]], elapsed: float):
+        """Prints the time taken by each country (slowest first), followed by the overall throughput"""
+        for short_name, rows, skipped, seconds in sorted(results, key=lambda result: result[3], reverse=True):
+            unchanged = f" ({skipped} unchanged files skipped)" if skipped else ""
+            self.stdout.write(f"{short_name:<10} {rows:>9} rows {seconds:>8.1f}s{unchanged}")
+
+        rows_written = sum(result[1] for result in results)
+        files_skipped = sum(result[2] for result in results)
+        rate = rows_written / elapsed if elapsed else 0
+        self.stdout.write(f"Wrote {rows_written} life table rows in {elapsed:.1f}s ({rate:.0f} rows/sec)")
+        self.stdout.write(f"Skipped {files_skipped} unchanged files")
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from hmd.store import LifeTableStore
+
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes every life table to the binary snapshot file memory-mapped by the hmd views. The file is swapped in "
+        "atomically, and every web process maps the new one within SNAPSHOT_CHECK_INTERVAL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=settings.LIFETABLE_SNAPSHOT_PATH, help="Destination file")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        store = LifeTableStore.from_database()
+        # Web processes notice the replaced file on their next check, and map it. Nothing is reloaded here
+        store.write_snapshot(options["path"])
+
+        tables = int(store.available.sum())
+        self.stdout.write(f"Wrote {tables} life tables to {options['path']} in {time.perf_counter() - start:.1f}s")
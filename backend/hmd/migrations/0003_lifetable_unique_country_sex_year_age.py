@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def delete_duplicate_entries(apps, schema_editor):
+    """Keeps the most recently loaded row of each (country, sex, year, age), so the unique constraint can be added"""
+    LifeTable = apps.get_model("hmd", "LifeTable")
+    duplicates = LifeTable.objects.values("country", "sex", "year", "age").annotate(latest_id=Max("id"), count=Count("id")).filter(count__gt=1)
+    for group in duplicates:
+        LifeTable.objects.filter(country=group["country"], sex=group["sex"], year=group["year"], age=group["age"]).exclude(
+            id=group["latest_id"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0002_auto_20210309_0427"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="lifetable",
+            constraint=models.UniqueConstraint(fields=("country", "sex", "year", "age"), name="unique_lifetable_country_sex_year_age"),
+        ),
+    ]
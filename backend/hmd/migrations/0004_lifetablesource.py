@@ -0,0 +1,47 @@
+# Generated by Django 4.2.1 on 2026-10-18 13:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0003_lifetable_unique_country_sex_year_age"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LifeTableSource",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path", models.CharField(max_length=255, unique=True)),
+                (
+                    "sex",
+                    models.CharField(
+                        choices=[("m", "m"), ("f", "f"), ("a", "a")],
+                        default="a",
+                        max_length=1,
+                    ),
+                ),
+                ("checksum", models.CharField(max_length=64)),
+                ("row_count", models.IntegerField()),
+                ("loaded_at", models.DateTimeField(auto_now=True)),
+                (
+                    "country",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="hmd.country",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_countries(apps, schema_editor):
+    """
+    Keeps the oldest country of each name, so the name can be made unique. Life tables of the removed duplicates are
+    dropped along with their manifest entries, so the next load_lifetables run reloads them under the kept country
+    """
+    Country = apps.get_model("hmd", "Country")
+    LifeTable = apps.get_model("hmd", "LifeTable")
+    LifeTableSource = apps.get_model("hmd", "LifeTableSource")
+    duplicates = Country.objects.values("name").annotate(first_id=Min("id"), count=Count("id")).filter(count__gt=1)
+    for group in duplicates:
+        removed = Country.objects.filter(name=group["name"]).exclude(id=group["first_id"])
+        LifeTable.objects.filter(country__in=removed).delete()
+        LifeTableSource.objects.filter(country__in=removed).delete()
+        for model_name in ["CountryAgePopulation", "CountryAgeDeaths", "CountryBirths"]:
+            apps.get_model("hmd", model_name).objects.filter(country__in=removed).update(country_id=group["first_id"])
+        removed.delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0004_lifetablesource"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_countries, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="country",
+            name="name",
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.1 on 2026-10-18 13:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+
+from hmd.arrays import pack_by_year
+
+
+def fill_compact_life_tables(apps, schema_editor):
+    """Packs the existing LifeTable rows, one (country, sex) slice at a time"""
+    LifeTable = apps.get_model("hmd", "LifeTable")
+    CompactLifeTable = apps.get_model("hmd", "CompactLifeTable")
+    slices = LifeTable.objects.values_list("country", "sex").distinct()
+    for country_id, sex in slices:
+        rows = LifeTable.objects.filter(country_id=country_id, sex=sex).values_list("year", "age", "probability", "cumulative_probability")
+        years, ages, probability, cumulative_probability = np.array(list(rows), dtype=float).T
+        tables = pack_by_year(years.astype(int), ages.astype(int), probability, cumulative_probability)
+        CompactLifeTable.objects.bulk_create(
+            [CompactLifeTable(country_id=country_id, sex=sex, year=year, probability=p, cumulative_probability=c) for year, p, c in tables]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0005_country_unique_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompactLifeTable",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sex",
+                    models.CharField(
+                        choices=[("m", "m"), ("f", "f"), ("a", "a")],
+                        default="a",
+                        max_length=1,
+                    ),
+                ),
+                ("year", models.IntegerField()),
+                ("probability", models.BinaryField()),
+                ("cumulative_probability", models.BinaryField()),
+                (
+                    "country",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="hmd.country",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="compactlifetable",
+            constraint=models.UniqueConstraint(
+                fields=("country", "sex", "year"),
+                name="unique_compactlifetable_country_sex_year",
+            ),
+        ),
+        migrations.RunPython(fill_compact_life_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.1 on 2026-10-18 13:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_availability(apps, schema_editor):
+    CompactLifeTable = apps.get_model("hmd", "CompactLifeTable")
+    LifeTableAvailability = apps.get_model("hmd", "LifeTableAvailability")
+    years = {}
+    for country_id, sex, year in CompactLifeTable.objects.values_list("country", "sex", "year").order_by("year"):
+        years.setdefault((country_id, sex), []).append(year)
+
+    LifeTableAvailability.objects.bulk_create(
+        [
+            LifeTableAvailability(country_id=country_id, sex=sex, min_year=values[0], max_year=values[-1], years=values)
+            for (country_id, sex), values in years.items()
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0006_compactlifetable"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LifeTableAvailability",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sex",
+                    models.CharField(
+                        choices=[("m", "m"), ("f", "f"), ("a", "a")],
+                        default="a",
+                        max_length=1,
+                    ),
+                ),
+                ("min_year", models.IntegerField()),
+                ("max_year", models.IntegerField()),
+                ("years", models.JSONField(default=list)),
+                (
+                    "country",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="hmd.country",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="lifetableavailability",
+            constraint=models.UniqueConstraint(
+                fields=("country", "sex"),
+                name="unique_lifetableavailability_country_sex",
+            ),
+        ),
+        migrations.RunPython(fill_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.1 on 2026-10-18 13:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+
+from hmd.arrays import unpack_floats
+from hmd.statistics import summarize_by_year
+
+
+def fill_summaries(apps, schema_editor):
+    """Summarizes the existing CompactLifeTable rows, one (country, sex) slice at a time"""
+    CompactLifeTable = apps.get_model("hmd", "CompactLifeTable")
+    LifeTableSummary = apps.get_model("hmd", "LifeTableSummary")
+    slices = CompactLifeTable.objects.values_list("country", "sex").distinct()
+    for country_id, sex in slices:
+        rows = CompactLifeTable.objects.filter(country_id=country_id, sex=sex).order_by("year").values_list("year", "probability")
+        years = np.array([year for year, _ in rows])
+        probability = np.stack([unpack_floats(p) for _, p in rows])
+        LifeTableSummary.objects.bulk_create(
+            [LifeTableSummary(country_id=country_id, sex=sex, **fields) for fields in summarize_by_year(years, probability)]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0007_lifetableavailability"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LifeTableSummary",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sex",
+                    models.CharField(
+                        choices=[("m", "m"), ("f", "f"), ("a", "a")],
+                        default="a",
+                        max_length=1,
+                    ),
+                ),
+                ("year", models.IntegerField()),
+                ("life_expectancy", models.FloatField()),
+                ("life_expectancies", models.BinaryField()),
+                ("median_age_at_death", models.FloatField()),
+                ("modal_age_at_death", models.IntegerField()),
+                (
+                    "country",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="hmd.country",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="lifetablesummary",
+            constraint=models.UniqueConstraint(
+                fields=("country", "sex", "year"),
+                name="unique_lifetablesummary_country_sex_year",
+            ),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
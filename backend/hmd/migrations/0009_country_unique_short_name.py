@@ -0,0 +1,51 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+SLICE_MODELS = ["LifeTable", "CompactLifeTable", "LifeTableAvailability", "LifeTableSummary", "LifeTableSource"]
+
+
+def split_shared_countries(apps, schema_editor):
+    """
+    Countries used to be keyed on their name, so folders sharing a title (eg: FRATNP and FRACNP) were loaded into one
+    country, overwriting each other's life tables. The manifest entries of such countries are dropped, so the next
+    load_lifetables run reloads every folder into a country of its own. Countries sharing a short name are merged the
+    way 0005 merged countries sharing a name, so the short name can be made unique
+    """
+    Country = apps.get_model("hmd", "Country")
+    LifeTableSource = apps.get_model("hmd", "LifeTableSource")
+
+    duplicates = Country.objects.values("short_name").annotate(first_id=Min("id"), count=Count("id")).filter(count__gt=1)
+    for group in duplicates:
+        removed = Country.objects.filter(short_name=group["short_name"]).exclude(id=group["first_id"])
+        for model_name in SLICE_MODELS:
+            apps.get_model("hmd", model_name).objects.filter(country__in=removed).delete()
+        for model_name in ["CountryAgePopulation", "CountryAgeDeaths", "CountryBirths"]:
+            apps.get_model("hmd", model_name).objects.filter(country__in=removed).update(country_id=group["first_id"])
+        removed.delete()
+
+    shared = {
+        source.country_id
+        for source in LifeTableSource.objects.filter(country__isnull=False).select_related("country")
+        if source.path.split("/")[0] != source.country.short_name
+    }
+    LifeTableSource.objects.filter(country__in=shared).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0008_lifetablesummary"),
+    ]
+
+    operations = [
+        migrations.RunPython(split_shared_countries, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="country",
+            name="name",
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="country",
+            name="short_name",
+            field=models.CharField(max_length=8, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def forget_loaded_files(apps, schema_editor):
+    """
+    Summaries used to be computed with ax = 1/2 at every age, and ax isn't stored, so they can only be corrected from
+    the HMD files. Emptying the manifest makes the next load_lifetables run reload, and summarize, every file
+    """
+    apps.get_model("hmd", "LifeTableSource").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0009_country_unique_short_name"),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_loaded_files, migrations.RunPython.noop),
+    ]
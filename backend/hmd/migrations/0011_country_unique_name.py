@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicates(apps, schema_editor):
+    """
+    Country names are unique again, as the API addresses countries by name. Countries loaded under the same name since
+    0009 get their short name appended, until a reload gives them the name of their title (eg: "France, Civilian
+    Population")
+    """
+    Country = apps.get_model("hmd", "Country")
+    duplicates = Country.objects.values("name").annotate(count=Count("id")).filter(count__gt=1)
+    for group in duplicates:
+        for country in Country.objects.filter(name=group["name"]).order_by("id")[1:]:
+            country.name = f"{country.name} ({country.short_name})"
+            country.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("hmd", "0010_recompute_summaries"),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="country",
+            name="name",
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -1,12 +1,15 @@
 from django.db import models
 from django.forms import model_to_dict
 
+import numpy as np
+from hmd.arrays import unpack_floats
+
 SEX_CHOICES = [("m", "m"), ("f", "f"), ("a", "a")]
 
 
 class Country(models.Model):
-    name = models.CharField(max_length=255)
-    short_name = models.CharField(max_length=8)
+    name = models.CharField(max_length=255, unique=True)  # As displayed, and as the API addresses countries
+    short_name = models.CharField(max_length=8, unique=True)  # HMD country code and folder, eg: FRATNP
 
     def __str__(self):
         return str(self.name)
@@ -42,8 +45,94 @@ class LifeTable(models.Model):
     probability = models.DecimalField(max_digits=10, decimal_places=5)
     cumulative_probability = models.DecimalField(max_digits=10, decimal_places=5)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["country", "sex", "year", "age"], name="unique_lifetable_country_sex_year_age"),
+        ]
+
     def __str__(self):
         return f"({self.age}{self.sex} {self.country}) - {self.probability}"
 
     def to_dict(self):
         return {self.id: model_to_dict(self)}
+
+
+# Same data as LifeTable, but with one row per (country, sex, year). Arrays are packed float32, indexed by age
+class CompactLifeTable(models.Model):
+    country = models.ForeignKey(Country, null=True, on_delete=models.SET_NULL)
+    sex = models.CharField(max_length=1, choices=SEX_CHOICES, default="a")
+    year = models.IntegerField()
+    probability = models.BinaryField()
+    cumulative_probability = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["country", "sex", "year"], name="unique_compactlifetable_country_sex_year"),
+        ]
+
+    def __str__(self):
+        return f"({self.year}{self.sex} {self.country})"
+
+    def probabilities(self) -> np.ndarray:
+        return unpack_floats(self.probability)
+
+    def cumulative_probabilities(self) -> np.ndarray:
+        return unpack_floats(self.cumulative_probability)
+
+
+class LifeTableAvailability(models.Model):
+    """Years with a life table, per (country, sex). Maintained by load_lifetables so year lookups don't scan LifeTable"""
+
+    country = models.ForeignKey(Country, null=True, on_delete=models.SET_NULL)
+    sex = models.CharField(max_length=1, choices=SEX_CHOICES, default="a")
+    min_year = models.IntegerField()
+    max_year = models.IntegerField()
+    years = models.JSONField(default=list)  # Ascending
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["country", "sex"], name="unique_lifetableavailability_country_sex"),
+        ]
+
+    def __str__(self):
+        return f"({self.sex} {self.country}) {self.min_year}-{self.max_year}"
+
+
+class LifeTableSummary(models.Model):
+    """Statistics derived from one life table by hmd.statistics. Maintained by load_lifetables"""
+
+    country = models.ForeignKey(Country, null=True, on_delete=models.SET_NULL)
+    sex = models.CharField(max_length=1, choices=SEX_CHOICES, default="a")
+    year = models.IntegerField()
+    life_expectancy = models.FloatField()  # At birth
+    life_expectancies = models.BinaryField()  # At every age, packed like CompactLifeTable
+    median_age_at_death = models.FloatField()
+    modal_age_at_death = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["country", "sex", "year"], name="unique_lifetablesummary_country_sex_year"),
+        ]
+
+    def __str__(self):
+        return f"({self.year}{self.sex} {self.country}) e0={self.life_expectancy:.2f}"
+
+    def life_expectancies_by_age(self) -> np.ndarray:
+        return unpack_floats(self.life_expectancies)
+
+
+class LifeTableSource(models.Model):
+    """
+    Manifest of the HMD files loaded into LifeTable. A file whose checksum hasn't changed since it was last loaded
+    is skipped by load_lifetables
+    """
+
+    path = models.CharField(max_length=255, unique=True)  # Relative to data/hmd_countries. eg: SWE/STATS/fltper_1x1.txt
+    country = models.ForeignKey(Country, null=True, on_delete=models.SET_NULL)
+    sex = models.CharField(max_length=1, choices=SEX_CHOICES, default="a")
+    checksum = models.CharField(max_length=64)  # sha256 of the file contents
+    row_count = models.IntegerField()
+    loaded_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.row_count} rows)"
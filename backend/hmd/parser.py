@@ -0,0 +1,88 @@
+import numpy as np
+from itertools import takewhile
+from typing import Dict, NamedTuple, Tuple
+
+"""
+    Parses HMD fixed-width STATS files (eg: COUNTRY/STATS/fltper_1x1.txt) into typed columns.
+    A whole file is converted in one pass with vectorized numpy operations, rather than row by row.
+"""
+
+MISSING_VALUE = "."
+OPEN_INTERVAL_MARKER = "+"
+# Start of the title field following the country name and population, eg: `Life tables (period 1x1)`
+LIFE_TABLES_MARKER = "Life tables"
+SEXES = {"Females": "f", "Males": "m", "Total": "a"}
+
+
+class HMDTable(NamedTuple):
+    """
+    Columnar contents of one HMD file. `year` and `age` are int arrays; `columns` maps every other header name
+    (eg: mx, qx, ax, lx, dx, Lx, Tx, ex) to a float array, where missing values are NaN.
+    `open_age` is True for rows of the open age interval (eg: 110+), whose age is stored as its lower bound
+    """
+
+    country: str
+    sex: str
+    year: np.ndarray
+    age: np.ndarray
+    open_age: np.ndarray
+    columns: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.year)
+
+
+def parse_hmd_file(path: str) -> HMDTable:
+    """
+    Parses an HMD 1x1 STATS file
+    :param path: path to the file
+    :return: HMDTable
+    """
+    with open(path, "r") as file:
+        return parse_hmd_text(file.read())
+
+
+def parse_hmd_title(line: str) -> Tuple[str, str]:
+    """
+    Reads the country and sex from the title line of an HMD file. Folders of one country with different populations
+    (eg: FRATNP and FRACNP) share the country part of their title, so the population qualifier is kept in the name:
+    `France, Civilian Population, Life tables (period 1x1), Females` -> ("France, Civilian Population", "f")
+    :param line: first line of the file
+    :return: (country, sex)
+    """
+    parts = [part.strip() for part in line.split("\t")[0].split(",")]
+    name = list(takewhile(lambda part: not part.startswith(LIFE_TABLES_MARKER), parts[:-1])) or parts[:1]
+    return ", ".join(name), SEXES.get(parts[-1], "a")
+
+
+def parse_hmd_text(text: str) -> HMDTable:
+    """
+    Parses the contents of an HMD 1x1 STATS file. The first line is a title like
+    `Sweden, Life tables (period 1x1), Females`, followed by a column header starting with `Year`, then data
+    :param text: file contents
+    :return: HMDTable
+    """
+    lines = text.splitlines()
+    country, sex = parse_hmd_title(lines[0])
+
+    header_index = next((i for i, line in enumerate(lines) if line.split()[:1] == ["Year"]), None)
+    if header_index is None:
+        raise ValueError(f"No column header found in HMD file for {country}")
+    names = lines[header_index].split()
+
+    tokens = np.array(" ".join(lines[header_index + 1 :]).split())
+    if tokens.size % len(names):
+        raise ValueError(f"HMD file for {country} has {tokens.size} values, which is not a multiple of {len(names)} columns")
+    cells = tokens.reshape(-1, len(names))
+
+    ages = np.char.rstrip(cells[:, 1], OPEN_INTERVAL_MARKER)
+    values = np.where(cells[:, 2:] == MISSING_VALUE, "nan", cells[:, 2:]).astype(np.float64)
+
+    return HMDTable(
+        country=country,
+        sex=sex,
+        year=cells[:, 0].astype(np.int32),
+        age=ages.astype(np.int32),
+        open_age=ages != cells[:, 1],
+        columns={name: values[:, i] for i, name in enumerate(names[2:])},
+    )
@@ -0,0 +1,67 @@
+from hmd.models import *
+from hmd.arrays import unpack_floats
+
+from django.db.models import QuerySet
+from typing import Dict, List, Optional
+
+# In-process map of country name -> id, so life table queries can filter on the indexed country_id without joining Country
+_country_ids: Dict[str, int] = {}
+
+
+def get_country_id(name: str) -> Optional[int]:
+    """
+    Resolves a country name to its id. The map is refreshed from the database on a miss, so countries added by a load
+    are picked up without restarting the process
+    :param name: Country name, as displayed to users
+    :return: Country id, or None if no such country exists
+    """
+    if name not in _country_ids:
+        _country_ids.update(Country.objects.values_list("name", "id"))
+    return _country_ids.get(name)
+
+
+def get_life_table_rows(country_id: int, sex: str, year: int) -> QuerySet:
+    """
+    Queries one life table. The filter matches a prefix of the (country, sex, year, age) unique index
+    :return: QuerySet of dicts with keys age, probability, cumulative_probability, ordered by age
+    """
+    return (
+        LifeTable.objects.filter(country_id=country_id, sex=sex, year=year, age__lte=109)
+        .order_by("age")
+        .values("age", "probability", "cumulative_probability")
+    )
+
+
+def get_availability() -> Dict[str, Dict[str, dict]]:
+    """
+    Returns the years with a life table for every country and sex
+    :return: dict of country name -> sex -> dict with keys min_year, max_year, years (ascending)
+    """
+    result: Dict[str, Dict[str, dict]] = {}
+    rows = LifeTableAvailability.objects.filter(country__isnull=False).values_list("country__name", "sex", "min_year", "max_year", "years")
+    for name, sex, min_year, max_year, years in rows.order_by("country__name", "sex"):
+        result.setdefault(name, {})[sex] = {"min_year": min_year, "max_year": max_year, "years": years}
+    return result
+
+
+def get_summaries(**filters) -> List[dict]:
+    """
+    Returns the LifeTableSummary rows matching `filters`, eg: country_id=1, or year=2000
+    :return: list of dicts with keys country, sex, year, life_expectancy, life_expectancies (by age, null once nobody
+    is left alive), median_age_at_death, modal_age_at_death. Ordered by country, sex, year
+    """
+    rows = LifeTableSummary.objects.filter(country__isnull=False, **filters).order_by("country__name", "sex", "year")
+    return [
+        {
+            "country": name,
+            "sex": sex,
+            "year": year,
+            "life_expectancy": round(life_expectancy, 2),
+            "life_expectancies": [None if x != x else round(x, 2) for x in unpack_floats(life_expectancies).tolist()],
+            "median_age_at_death": round(median, 2),
+            "modal_age_at_death": modal,
+        }
+        for name, sex, year, life_expectancy, life_expectancies, median, modal in rows.values_list(
+            "country__name", "sex", "year", "life_expectancy", "life_expectancies", "median_age_at_death", "modal_age_at_death"
+        )
+    ]
@@ -0,0 +1,62 @@
+import json
+import numpy as np
+from typing import Any, List, Optional, Tuple
+
+from django.http import HttpResponse
+
+"""
+    JSON serialization for the hmd endpoints. Probabilities are written as plain numbers at a fixed precision, straight
+    from float arrays, instead of going through DjangoJSONEncoder as Decimals (which it sends as strings).
+"""
+
+PRECISION = 5
+LIFE_TABLE_ROW = f'{{"age":%d,"probability":%.{PRECISION}f,"cumulative_probability":%.{PRECISION}f}}'
+NUMBER = f"%.{PRECISION}f"
+
+
+def serialize_life_table(probability: np.ndarray, cumulative: np.ndarray) -> bytes:
+    """
+    Renders a life table as a JSON list of {age, probability, cumulative_probability}. Ages whose probability is NaN
+    (no row) are left out, as is the open age interval (110+), which is the last entry of the arrays
+    :param probability: qx, indexed by age
+    :param cumulative: lx / 100000, indexed by age
+    """
+    rows = [
+        LIFE_TABLE_ROW % (age, qx, lx)
+        for age, qx, lx in zip(range(len(probability) - 1), probability.tolist(), cumulative.tolist())
+        if qx == qx  # NaN marks ages without a row
+    ]
+    return ("[" + ",".join(rows) + "]").encode()
+
+
+def serialize_matrix(values: np.ndarray) -> bytes:
+    """Renders a matrix as one flat JSON list in row-major order, with null where a value is NaN"""
+    return ("[" + ",".join("null" if x != x else NUMBER % x for x in values.ravel().tolist()) + "]").encode()
+
+
+def to_json_list(values: np.ndarray) -> list:
+    """Converts an array to nested lists of numbers rounded to PRECISION, with None where a value isn't finite"""
+    values = np.round(values.astype(np.float64), PRECISION)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def serialize(data: Any) -> bytes:
+    """Compact JSON for plain python data (lists, dicts, ints, strings)"""
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def serialize_life_tables(tables: List[Tuple[str, str, int, Optional[bytes]]]) -> bytes:
+    """
+    Renders many life tables as a JSON list of {country, sex, year, table}. Tables are spliced in already serialized
+    (eg: pre-rendered by the store), so they're never parsed or encoded again
+    :param tables: (country, sex, year, table body), where a None body stands for a missing table, sent as []
+    """
+    items = [
+        serialize({"country": country, "sex": sex, "year": year})[:-1] + b',"table":' + (body or b"[]") + b"}"
+        for country, sex, year, body in tables
+    ]
+    return b"[" + b",".join(items) + b"]"
+
+
+def json_response(body: bytes) -> HttpResponse:
+    return HttpResponse(body, content_type="application/json")
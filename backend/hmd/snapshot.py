@@ -0,0 +1,96 @@
+import os
+import json
+import mmap
+import struct
+import time
+import numpy as np
+from typing import Dict, Tuple
+
+"""
+    Binary snapshot of every life table, memory-mapped read-only by the hmd views. Every WSGI process maps the same file,
+    so they share its physical pages, and opening it costs no parsing.
+
+    Layout:
+        header      magic (8 bytes), format version (uint32), metadata length (uint32)
+        metadata    utf-8 JSON: dataset version, countries, sexes, first_year, and the dtype, shape and offset of every array
+        arrays      C-ordered little endian arrays, each starting on an ALIGNMENT byte boundary.
+                    Offsets are relative to the first boundary after the metadata
+
+    Snapshots are written to a temporary file and renamed over the old one, so readers never see a partial file.
+"""
+
+MAGIC = b"MEDISTAT"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 64
+ARRAY_NAMES = ["probability", "cumulative", "available", "payloads", "payload_offsets"]
+
+
+def align(position: int) -> int:
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(path: str, countries: list, sexes: list, first_year: int, version: str, arrays: Dict[str, np.ndarray]) -> None:
+    """
+    Atomically writes a snapshot
+    :param path: destination file. It is replaced if it exists
+    :param countries: (id, name) of every country, in the order of the first axis of the arrays
+    :param sexes: sexes, in the order of the second axis of the arrays
+    :param first_year: year of the first entry of the third axis of the arrays
+    :param version: dataset version
+    :param arrays: dict of every name in ARRAY_NAMES -> array
+    """
+    arrays = {name: np.ascontiguousarray(arrays[name]) for name in ARRAY_NAMES}
+    specs = {}
+    position = 0
+    for name, array in arrays.items():
+        specs[name] = {"dtype": array.dtype.newbyteorder("<").str, "shape": array.shape, "offset": position}
+        position = align(position + array.nbytes)
+
+    metadata = {"created": time.time(), "version": version, "countries": countries, "sexes": sexes, "first_year": first_year, "arrays": specs}
+    encoded = json.dumps(metadata).encode()
+    data_start = align(HEADER.size + len(encoded))
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+        file.write(encoded)
+        for name, array in arrays.items():
+            file.write(b"\0" * (data_start + specs[name]["offset"] - file.tell()))
+            file.write(array.astype(specs[name]["dtype"], copy=False).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_snapshot(path: str) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """
+    Memory-maps a snapshot read-only. The returned arrays are views of the mapping, which stays open while they're referenced
+    :return: (metadata, dict of array name -> read-only array)
+    """
+    with open(path, "rb") as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, metadata_length = HEADER.unpack_from(mapping, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a life table snapshot")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has snapshot format version {version}. Expected {FORMAT_VERSION}")
+
+    metadata = json.loads(mapping[HEADER.size : HEADER.size + metadata_length])
+    data_start = align(HEADER.size + metadata_length)
+    arrays = {}
+    for name, spec in metadata["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = np.frombuffer(mapping, dtype=dtype, count=count, offset=data_start + spec["offset"]).reshape(spec["shape"])
+    return metadata, arrays
+
+
+def get_identity(path: str):
+    """Returns a value that changes whenever the snapshot at `path` is replaced, or None if there is no snapshot"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
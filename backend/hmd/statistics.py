@@ -0,0 +1,119 @@
+import numpy as np
+from typing import List, NamedTuple, Optional, Tuple
+
+from hmd.arrays import pack_floats
+
+"""
+    Statistics derived from life tables, computed for any number of tables at once. Inputs are qx arrays whose last
+    axis is age (0-109, then the open interval 110+), so a whole store, or every year of one file, is one call.
+
+    Person years are counted with ax, the average years lived within an age by those who die in it, which the HMD files
+    give for every age, including the open interval. Only qx and lx are stored though, so where ax isn't passed (eg: when
+    summaries are backfilled from CompactLifeTable), deaths are assumed to fall in the middle of each age (ax = 1/2).
+    The median age at death interpolates l_x linearly within the age it falls in, and the modal age doesn't need ax.
+"""
+
+# The modal age at death is looked for from this age on, past the deaths of infancy and childhood
+MODAL_AGE_MIN = 10
+# How pairs of curves can be compared
+COMPARISON_MEASURES = ("difference", "ratio")
+
+
+class LifeTableStatistics(NamedTuple):
+    life_expectancy: np.ndarray  # e_x, shaped like the input
+    median_age_at_death: np.ndarray  # Age by which half of the cohort has died. Shaped like the input minus age
+    modal_age_at_death: np.ndarray  # Age (from MODAL_AGE_MIN) at which most deaths happen. Shaped like median
+
+
+def survivorship(probability: np.ndarray) -> np.ndarray:
+    """
+    Derives l_x from qx, with l_0 = 1
+    :param probability: qx, age on the last axis. Missing values (NaN, or the 100 stored for them) are taken as 1
+    :return: l_x, with one more entry on the last axis than `probability`: survivors past the open interval, 0
+    """
+    probability = np.asarray(probability, dtype=np.float64)
+    q = np.clip(np.nan_to_num(probability, nan=1.0), 0.0, 1.0)
+    q[..., -1] = 1.0  # Nobody survives the open interval
+    alive = np.cumprod(1.0 - q, axis=-1)
+    return np.concatenate([np.ones(alive.shape[:-1] + (1,)), alive], axis=-1)
+
+
+def compute_statistics(probability: np.ndarray, separation: Optional[np.ndarray] = None) -> LifeTableStatistics:
+    """
+    Computes life expectancy at every age, and the median and modal ages at death, of every table in `probability`.
+    Tables without a single qx (all NaN) get NaN everywhere
+    :param probability: qx, shaped (..., AGE_COUNT)
+    :param separation: ax, shaped like `probability`. Missing values (NaN), or a missing array, are taken as 1/2
+    """
+    probability = np.asarray(probability, dtype=np.float64)
+    alive = survivorship(probability)
+    start, end = alive[..., :-1], alive[..., 1:]
+    deaths = start - end
+    # L_x = l_x+1 + ax * d_x. In the open interval, nobody survives, so it's ax * l_x, where ax is e_x
+    ax = 0.5 if separation is None else np.nan_to_num(np.asarray(separation, dtype=np.float64), nan=0.5)
+    person_years = end + ax * deaths
+
+    # T_x: person years lived past age x
+    remaining = np.cumsum(person_years[..., ::-1], axis=-1)[..., ::-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        life_expectancy = np.where(start > 0, remaining / start, np.nan)
+
+        # Survivors fall below 1/2 during the first age where `end` does. Interpolate linearly within it
+        age = np.argmax(end <= 0.5, axis=-1)
+        before = np.take_along_axis(start, age[..., None], axis=-1)[..., 0]
+        after = np.take_along_axis(end, age[..., None], axis=-1)[..., 0]
+        median = age + (before - 0.5) / (before - after)
+
+    modal = (np.argmax(deaths[..., MODAL_AGE_MIN:], axis=-1) + MODAL_AGE_MIN).astype(np.float64)
+
+    missing = np.isnan(probability).all(axis=-1)
+    return LifeTableStatistics(
+        np.where(missing[..., None], np.nan, life_expectancy),
+        np.where(missing, np.nan, median),
+        np.where(missing, np.nan, modal),
+    )
+
+
+def summarize_by_year(
+    years: np.ndarray, probability: np.ndarray, separation: Optional[np.ndarray] = None, life_expectancy: Optional[np.ndarray] = None
+) -> List[dict]:
+    """
+    Computes the LifeTableSummary fields of every year of one (country, sex) slice
+    :param years: year of each row of `probability`
+    :param probability: qx, shaped (len(years), AGE_COUNT)
+    :param separation: ax, shaped like `probability`, if known. See compute_statistics
+    :param life_expectancy: ex as published, shaped like `probability`, if known. Used as it is where it isn't NaN, so
+    summaries match HMD's own figures, rather than ones derived from rounded qx
+    :return: list of dicts with keys year, life_expectancy, life_expectancies, median_age_at_death, modal_age_at_death
+    """
+    statistics = compute_statistics(probability, separation)
+    if life_expectancy is not None:
+        life_expectancy = np.asarray(life_expectancy, dtype=np.float64)
+        statistics = statistics._replace(life_expectancy=np.where(np.isnan(life_expectancy), statistics.life_expectancy, life_expectancy))
+    return [
+        {
+            "year": int(year),
+            "life_expectancy": float(statistics.life_expectancy[i, 0]),
+            "life_expectancies": pack_floats(statistics.life_expectancy[i]),
+            "median_age_at_death": float(statistics.median_age_at_death[i]),
+            "modal_age_at_death": int(statistics.modal_age_at_death[i]),
+        }
+        for i, year in enumerate(years.tolist())
+        if not np.isnan(statistics.modal_age_at_death[i])
+    ]
+
+
+def compare_pairwise(curves: np.ndarray, measure: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compares every pair of curves at every age, by broadcasting the curves against themselves
+    :param curves: shaped (curves, ages)
+    :param measure: one of COMPARISON_MEASURES. For the pair (i, j), curves[i] - curves[j], or curves[i] / curves[j]
+    :return: (pairs, shaped (pair count, 2), of indices i < j into curves, values shaped (pair count, ages)). Ratios
+    with a zero denominator are inf or NaN
+    """
+    curves = np.asarray(curves, dtype=np.float64)
+    first, second = curves[:, None, :], curves[None, :, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = first - second if measure == "difference" else first / second
+    i, j = np.triu_indices(len(curves), k=1)
+    return np.stack([i, j], axis=1), values[i, j]
@@ -0,0 +1,241 @@
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from hmd import snapshot
+from hmd.arrays import AGE_COUNT, PACKED_DTYPE, unpack_floats
+from hmd.models import CompactLifeTable, Country
+from hmd.serializers import serialize_life_table
+
+"""
+    Immutable, process-wide store of every life table, held as dense arrays indexed by [country, sex, year, age].
+    The hmd views answer from it without querying the database, and life tables are sent as pre-rendered bytes.
+
+    If the snapshot file at settings.LIFETABLE_SNAPSHOT_PATH exists, the store memory-maps it. Each process stats the
+    file at most once per SNAPSHOT_CHECK_INTERVAL, and maps it again once it was replaced: this is how web processes pick
+    up the tables written by load_lifetables (through write_lifetable_snapshot), since no command can reach into them.
+    Without a snapshot file, the store is loaded from the database on first use, and kept for the life of the process
+"""
+
+# Seconds between checks for a replaced snapshot file
+SNAPSHOT_CHECK_INTERVAL = 1.0
+# Life table columns a surface can be read from
+SURFACE_COLUMNS = ("probability", "cumulative_probability")
+
+
+class LifeTableStore:
+    def __init__(
+        self,
+        countries: List[Tuple[int, str]],
+        sexes: List[str],
+        first_year: int,
+        probability: np.ndarray,
+        cumulative: np.ndarray,
+        available: Optional[np.ndarray] = None,
+        payloads: Optional[np.ndarray] = None,
+        payload_offsets: Optional[np.ndarray] = None,
+        version: Optional[str] = None,
+    ):
+        """
+        :param countries: (id, name) of every country, in the order of the first axis of the arrays
+        :param sexes: sexes in the order of the second axis of the arrays
+        :param first_year: year of the first entry of the third axis of the arrays
+        :param probability: qx, shaped (countries, sexes, years, ages). NaN where there is no life table row
+        :param cumulative: lx / 100000, shaped like probability
+        :param available: available[c, s, y] is True where that life table has at least one row. Derived if not given
+        :param payloads: lifetables/ response bodies of every table, concatenated. Rendered if not given
+        :param payload_offsets: the body of the table at flat index i of available is payloads[offsets[i]:offsets[i + 1]]
+        :param version: dataset version, which changes whenever any table does. Derived if not given
+        """
+        self.countries = countries
+        self.sexes = sexes
+        self.first_year = first_year
+        self.probability = probability
+        self.cumulative = cumulative
+        self.country_index = {name: i for i, (_, name) in enumerate(countries)}
+        self.sex_index = {sex: i for i, sex in enumerate(sexes)}
+        self.available = available if available is not None else ~np.isnan(probability).all(axis=3)
+        if payloads is None or payload_offsets is None:
+            payloads, payload_offsets = self.render_payloads()
+        self.payloads = payloads
+        self.payload_offsets = payload_offsets
+        self.version = version or self.compute_version()
+
+        for array in (self.probability, self.cumulative, self.available, self.payloads, self.payload_offsets):
+            array.flags.writeable = False
+
+    @classmethod
+    def from_database(cls) -> "LifeTableStore":
+        countries = list(Country.objects.order_by("name").values_list("id", "name"))
+        rows = list(
+            CompactLifeTable.objects.filter(country__isnull=False).values_list(
+                "country_id", "sex", "year", "probability", "cumulative_probability"
+            )
+        )
+        years = [row[2] for row in rows]
+        first_year = min(years, default=0)
+        year_count = max(years, default=-1) - first_year + 1
+        sexes = sorted({row[1] for row in rows})
+
+        shape = (len(countries), len(sexes), year_count, AGE_COUNT)
+        probability = np.full(shape, np.nan, dtype=PACKED_DTYPE)
+        cumulative = np.full(shape, np.nan, dtype=PACKED_DTYPE)
+        country_index = {country_id: i for i, (country_id, _) in enumerate(countries)}
+        sex_index = {sex: i for i, sex in enumerate(sexes)}
+        for country_id, sex, year, packed_probability, packed_cumulative in rows:
+            index = (country_index[country_id], sex_index[sex], year - first_year)
+            probability[index] = unpack_floats(packed_probability)
+            cumulative[index] = unpack_floats(packed_cumulative)
+
+        return cls(countries, sexes, first_year, probability, cumulative)
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "LifeTableStore":
+        """Memory-maps a snapshot written by write_snapshot(). Nothing is parsed or copied"""
+        metadata, arrays = snapshot.read_snapshot(path)
+        countries = [(country_id, name) for country_id, name in metadata["countries"]]
+        return cls(countries, metadata["sexes"], metadata["first_year"], version=metadata["version"], **arrays)
+
+    def write_snapshot(self, path: str) -> None:
+        arrays = {name: getattr(self, name) for name in snapshot.ARRAY_NAMES}
+        snapshot.write_snapshot(path, self.countries, self.sexes, self.first_year, self.version, arrays)
+
+    def render_payloads(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Renders the lifetables/ response body of every table, so requests only have to look the bytes up
+        :return: (concatenated bodies as uint8, offsets into them, one per flat index of available plus an end offset)
+        """
+        bodies = [b""] * self.available.size
+        for flat_index in np.flatnonzero(self.available):
+            index = np.unravel_index(flat_index, self.available.shape)
+            bodies[flat_index] = serialize_life_table(self.probability[index], self.cumulative[index])
+
+        payload_offsets = np.zeros(len(bodies) + 1, dtype=np.int64)
+        np.cumsum([len(body) for body in bodies], out=payload_offsets[1:])
+        return np.frombuffer(b"".join(bodies), dtype=np.uint8), payload_offsets
+
+    def compute_version(self) -> str:
+        """Hashes the tables and their index. Equal datasets always get the same version"""
+        digest = hashlib.sha256(json.dumps([self.countries, self.sexes, self.first_year]).encode())
+        digest.update(self.probability.tobytes())
+        digest.update(self.cumulative.tobytes())
+        return digest.hexdigest()[:16]
+
+    def get_countries(self) -> List[dict]:
+        """Returns every country as a dict with keys id, name, ordered by name"""
+        return [{"id": country_id, "name": name} for country_id, name in self.countries]
+
+    def get_years(self, country: str) -> List[int]:
+        """Returns every year with a life table for the given country (of either sex), most recent first"""
+        if country not in self.country_index:
+            return []
+        year_offsets = np.flatnonzero(self.available[self.country_index[country]].any(axis=0))
+        return (year_offsets[::-1] + self.first_year).tolist()
+
+    def get_years_by_sex(self, country: str) -> Dict[str, List[int]]:
+        """Returns the years with a life table for each sex of the given country, most recent first"""
+        if country not in self.country_index:
+            return {}
+        available = self.available[self.country_index[country]]
+        return {sex: (np.flatnonzero(available[i])[::-1] + self.first_year).tolist() for i, sex in enumerate(self.sexes)}
+
+    def get_table(self, country: str, sex: str, year: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns one life table as (qx, lx / 100000) arrays indexed by age, or None if there is no such table
+        """
+        index = self.get_index(country, sex, year)
+        if index is None:
+            return None
+        return self.probability[index], self.cumulative[index]
+
+    def get_payload(self, country: str, sex: str, year: int) -> Optional[bytes]:
+        """Returns the pre-rendered lifetables/ response body of one life table, or None if there is no such table"""
+        index = self.get_index(country, sex, year)
+        if index is None:
+            return None
+        flat_index = np.ravel_multi_index(index, self.available.shape)
+        return self.payloads[self.payload_offsets[flat_index] : self.payload_offsets[flat_index + 1]].tobytes()
+
+    def get_index(self, country: str, sex: str, year: int) -> Optional[Tuple[int, int, int]]:
+        """Returns the (country, sex, year) index of a life table into the arrays, or None if there is no such table"""
+        if country not in self.country_index or sex not in self.sex_index:
+            return None
+        year_offset = year - self.first_year
+        if not 0 <= year_offset < self.available.shape[2]:
+            return None
+        index = (self.country_index[country], self.sex_index[sex], year_offset)
+        if not self.available[index]:
+            return None
+        return index
+
+    def get_surface(self, country: str, sex: str, column: str) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Returns one column of every life table of a country and sex, as a (years, ages) matrix. It spans every year
+        from the first to the last with a table, so years without one are rows of NaN. The open age interval (110+)
+        is left out. The matrix is a view into the store, so it's read-only
+        :param column: one of SURFACE_COLUMNS
+        :return: (first year, matrix), or None if there is no table
+        """
+        if country not in self.country_index or sex not in self.sex_index:
+            return None
+        index = (self.country_index[country], self.sex_index[sex])
+        year_offsets = np.flatnonzero(self.available[index])
+        if not len(year_offsets):
+            return None
+
+        values = self.probability if column == "probability" else self.cumulative
+        first, last = year_offsets[0], year_offsets[-1]
+        return self.first_year + int(first), values[index][first : last + 1, : AGE_COUNT - 1]
+
+    def get_curves(self, countries: List[str], sex: str, year: int, column: str) -> Tuple[List[str], np.ndarray]:
+        """
+        Returns one column of the life tables of many countries in the same year, as a (countries, ages) matrix read
+        with one fancy index. The open age interval (110+) is left out
+        :param column: one of SURFACE_COLUMNS
+        :return: (countries with a table, in the order given, matrix with one row for each of them)
+        """
+        indices = [(country, self.get_index(country, sex, year)) for country in countries]
+        found = [(country, index) for country, index in indices if index is not None]
+        values = self.probability if column == "probability" else self.cumulative
+        if not found:
+            return [], np.empty((0, AGE_COUNT - 1), dtype=values.dtype)
+        country_indices, sex_indices, year_offsets = zip(*[index for _, index in found])
+        return [country for country, _ in found], values[list(country_indices), list(sex_indices), list(year_offsets), : AGE_COUNT - 1]
+
+
+_store: Optional[LifeTableStore] = None
+_snapshot_identity = None  # Identity of the snapshot file _store was mapped from, if any
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_store() -> LifeTableStore:
+    """
+    Returns the process-wide store. At most once per SNAPSHOT_CHECK_INTERVAL, the snapshot file is checked, and
+    mapped again if it was replaced
+    """
+    global _checked_at
+    if _store is not None and time.monotonic() - _checked_at < SNAPSHOT_CHECK_INTERVAL:
+        return _store
+
+    with _lock:
+        _checked_at = time.monotonic()
+        identity = snapshot.get_identity(settings.LIFETABLE_SNAPSHOT_PATH)
+        if (identity and identity != _snapshot_identity) or _store is None:
+            _load(identity)
+        return _store
+
+
+def _load(identity) -> None:
+    """Loads the store. Callers must hold _lock"""
+    global _store, _snapshot_identity
+    if identity:
+        _store = LifeTableStore.from_snapshot(settings.LIFETABLE_SNAPSHOT_PATH)
+    else:
+        _store = LifeTableStore.from_database()
+    _snapshot_identity = identity
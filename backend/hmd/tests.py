@@ -1,3 +1,370 @@
-from django.test import TestCase
+import os
+import json
+import math
+import tempfile
+import numpy as np
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from hmd import parser  # System under test
+from hmd import business
+from hmd import serializers
+from hmd import statistics
+from hmd import views
+from hmd.arrays import AGE_COUNT, to_age_grid, unpack_floats
+from hmd.store import LifeTableStore
+from util.tests import LOCAL_CACHES
+
+SAMPLE_FILE = """Sweden, Life tables (period 1x1), Females\tLast modified: 24 Jan 2023;  Methods Protocol: v6 (2017)
+
+  Year          Age         mx       qx    ax      lx      dx      Lx       Tx     ex
+  1751            0     0.20885  0.18460  0.31   100000   18460   87263  3863837  38.64
+  1751            1     0.06382  0.06189  0.50    81540    5046   79017  3776574  46.31
+  1751         110+          .   1.00000     .        .       .       .        .      .
+"""
+
+
+class ParserTests(SimpleTestCase):
+    def setUp(self):
+        self.table = parser.parse_hmd_text(SAMPLE_FILE)
+
+    def test_header(self):
+        """The country and sex should be read from the title line"""
+        self.assertEqual(self.table.country, "Sweden")
+        self.assertEqual(self.table.sex, "f")
+
+    def test_population_in_name(self):
+        """Folders of one country with different populations should get different names"""
+        title = "France, Civilian Population, Life tables (period 1x1), Males\tLast modified: 24 Jan 2023"
+        self.assertEqual(parser.parse_hmd_title(title), ("France, Civilian Population", "m"))
+
+    def test_columns(self):
+        """Every data row should be parsed into typed columns, including the first one"""
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table.year.tolist(), [1751, 1751, 1751])
+        self.assertEqual(self.table.columns["qx"].tolist(), [0.1846, 0.06189, 1.0])
+        self.assertEqual(self.table.columns["lx"][1], 81540)
+
+    def test_open_age_interval(self):
+        """`110+` should be stored as age 110, and flagged as the open interval"""
+        self.assertEqual(self.table.age.tolist(), [0, 1, 110])
+        self.assertEqual(self.table.open_age.tolist(), [False, False, True])
+
+    def test_missing_values(self):
+        """`.` should be parsed as NaN"""
+        self.assertTrue(math.isnan(self.table.columns["lx"][2]))
+        self.assertTrue(math.isnan(self.table.columns["mx"][2]))
+
+    def test_ragged_file(self):
+        """A file whose values don't fill every column should be rejected"""
+        with self.assertRaises(ValueError):
+            parser.parse_hmd_text(SAMPLE_FILE + "  1752  0  0.1\n")
+
+
+def make_store() -> LifeTableStore:
+    """Sweden has female tables for 2000 and 2002, and a male table for 2001. Norway has no tables"""
+    probability = np.full((2, 2, 3, AGE_COUNT), np.nan, dtype=np.float32)
+    probability[1, 0, 0, :] = 0.25
+    probability[1, 0, 2, :3] = 0.5
+    probability[1, 1, 1, :] = 0.75
+    cumulative = np.where(np.isnan(probability), np.nan, 1.0).astype(np.float32)
+    return LifeTableStore([(2, "Norway"), (1, "Sweden")], ["f", "m"], 2000, probability, cumulative)
+
+
+def patch_store(test: SimpleTestCase, store: LifeTableStore) -> None:
+    """Has the business layer read from `store` until the end of `test`"""
+    for target in ("hmd.business.get_store", "hmd.store.get_store"):
+        patcher = mock.patch(target, lambda: store)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+class StoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = make_store()
+
+    def test_countries(self):
+        self.assertEqual(self.store.get_countries(), [{"id": 2, "name": "Norway"}, {"id": 1, "name": "Sweden"}])
+
+    def test_years(self):
+        """Years of either sex should be returned, most recent first"""
+        self.assertEqual(self.store.get_years("Sweden"), [2002, 2001, 2000])
+        self.assertEqual(self.store.get_years("Norway"), [])
+        self.assertEqual(self.store.get_years("Atlantis"), [])
+
+    def test_years_by_sex(self):
+        self.assertEqual(self.store.get_years_by_sex("Sweden"), {"f": [2002, 2000], "m": [2001]})
+        self.assertEqual(self.store.get_years_by_sex("Norway"), {"f": [], "m": []})
+        self.assertEqual(self.store.get_years_by_sex("Atlantis"), {})
+
+    def test_life_table(self):
+        """Ages without a row, and the open age interval, should be left out"""
+        table = json.loads(self.store.get_payload("Sweden", "f", 2002))
+        self.assertEqual(table[0], {"age": 0, "probability": 0.5, "cumulative_probability": 1.0})
+        self.assertEqual([row["age"] for row in table], [0, 1, 2])
+        self.assertEqual(len(json.loads(self.store.get_payload("Sweden", "f", 2000))), AGE_COUNT - 1)
+
+    def test_missing_life_table(self):
+        self.assertIsNone(self.store.get_payload("Sweden", "m", 2000))
+        self.assertIsNone(self.store.get_payload("Sweden", "f", 1900))
+        self.assertIsNone(self.store.get_payload("Sweden", "a", 2000))
+
+    def test_surface(self):
+        """Surfaces should span the first to the last year with a table, with NaN rows for the years between"""
+        first_year, values = self.store.get_surface("Sweden", "f", "probability")
+        self.assertEqual(first_year, 2000)
+        self.assertEqual(values.shape, (3, AGE_COUNT - 1))
+        self.assertTrue((values[0] == 0.25).all())
+        self.assertTrue(np.isnan(values[1]).all())
+        self.assertEqual(values[2, :3].tolist(), [0.5] * 3)
+        self.assertEqual(self.store.get_surface("Sweden", "m", "cumulative_probability")[0], 2001)
+        self.assertIsNone(self.store.get_surface("Norway", "f", "probability"))
+
+    def test_curves(self):
+        """Curves should be aligned by age, in the order asked for, leaving out countries without a table"""
+        countries, curves = self.store.get_curves(["Sweden", "Atlantis", "Norway"], "f", 2002, "probability")
+        self.assertEqual(countries, ["Sweden"])
+        self.assertEqual(curves.shape, (1, AGE_COUNT - 1))
+        self.assertEqual(curves[0, :3].tolist(), [0.5] * 3)
+        self.assertEqual(self.store.get_curves(["Norway"], "f", 2002, "probability")[1].shape, (0, AGE_COUNT - 1))
+
+    def test_snapshot_round_trip(self):
+        """A store mapped from a snapshot should hold the same tables as the store that wrote it"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lifetables.snapshot")
+            self.store.write_snapshot(path)
+            mapped = LifeTableStore.from_snapshot(path)
+
+            self.assertEqual(mapped.get_countries(), self.store.get_countries())
+            self.assertEqual(mapped.get_years("Sweden"), [2002, 2001, 2000])
+            self.assertEqual(json.loads(mapped.get_payload("Sweden", "f", 2002)), json.loads(self.store.get_payload("Sweden", "f", 2002)))
+            self.assertEqual(mapped.get_payload("Sweden", "m", 2001), self.store.get_payload("Sweden", "m", 2001))
+            self.assertEqual(mapped.version, self.store.version)
+            self.assertFalse(mapped.probability.flags.writeable)
+
+    def test_payloads(self):
+        """Pre-rendered bodies should match serializing the table on demand"""
+        self.assertEqual(
+            self.store.get_payload("Sweden", "f", 2002), serializers.serialize_life_table(*self.store.get_table("Sweden", "f", 2002))
+        )
+        self.assertIsNone(self.store.get_payload("Sweden", "m", 2000))
+
+
+class StatisticsTests(SimpleTestCase):
+    def test_everyone_dies_at_80(self):
+        probability = np.zeros(AGE_COUNT)
+        probability[80] = 1.0
+        result = statistics.compute_statistics(probability)
+        self.assertAlmostEqual(result.life_expectancy[0], 80.5)
+        self.assertAlmostEqual(result.life_expectancy[30], 50.5)
+        self.assertAlmostEqual(float(result.median_age_at_death), 80.5)
+        self.assertEqual(float(result.modal_age_at_death), 80)
+
+    def test_separation(self):
+        """Sweden 1751, females: with HMD's a0 = 0.31 and T1 / l1 = 46.3156, e0 should be HMD's 38.64, not 38.67"""
+        probability, separation = np.zeros(AGE_COUNT), np.full(AGE_COUNT, 0.5)
+        probability[0], separation[0] = 0.1846, 0.31
+        # Everyone left at 1 dies at 47, which gives the e1 of the published table
+        probability[47], separation[47] = 1.0, 3776574 / 81540 - 46
+        result = statistics.compute_statistics(probability, separation)
+        self.assertAlmostEqual(result.life_expectancy[1], 46.3156, places=4)
+        self.assertAlmostEqual(result.life_expectancy[0], 38.64, places=2)
+
+    def test_open_interval(self):
+        """In the open interval, life expectancy is its ax"""
+        separation = np.full(AGE_COUNT, 0.5)
+        separation[-1] = 1.7
+        result = statistics.compute_statistics(np.zeros(AGE_COUNT), separation)
+        self.assertAlmostEqual(result.life_expectancy[-1], 1.7)
+        self.assertAlmostEqual(result.life_expectancy[0], AGE_COUNT - 1 + 1.7)
+
+    def test_published_life_expectancy(self):
+        """Summaries of an HMD file should carry the file's own ex"""
+        table = parser.parse_hmd_text(SAMPLE_FILE)
+        grids = [to_age_grid(table.year, table.age, table.columns[name]) for name in ("qx", "ax", "ex")]
+        summaries = statistics.summarize_by_year(grids[0][0], *[grid for _, grid in grids])
+        self.assertAlmostEqual(summaries[0]["life_expectancy"], 38.64, places=4)
+        self.assertAlmostEqual(float(unpack_floats(summaries[0]["life_expectancies"])[1]), 46.31, places=4)
+
+    def test_constant_hazard(self):
+        """Half the cohort dying every year: deaths peak at birth, but the modal age ignores childhood"""
+        result = statistics.compute_statistics(np.full(AGE_COUNT, 0.5))
+        self.assertAlmostEqual(result.life_expectancy[0], 1.5)
+        self.assertAlmostEqual(float(result.median_age_at_death), 1.0)
+        self.assertEqual(float(result.modal_age_at_death), statistics.MODAL_AGE_MIN)
+
+    def test_many_tables(self):
+        """Tables can be stacked on any number of axes, and missing ones give NaN"""
+        probability = np.full((2, 3, AGE_COUNT), 0.5)
+        probability[1, 2] = np.nan
+        result = statistics.compute_statistics(probability)
+        self.assertEqual(result.life_expectancy.shape, (2, 3, AGE_COUNT))
+        self.assertEqual(result.median_age_at_death.shape, (2, 3))
+        self.assertTrue(np.isnan(result.median_age_at_death[1, 2]))
+        self.assertEqual(result.median_age_at_death[0, 0], 1.0)
+
+    def test_summarize_by_year(self):
+        """Missing values are stored as 100, and should count as everyone dying"""
+        probability = np.full((2, AGE_COUNT), np.nan)
+        probability[0, :] = 0.0
+        probability[0, 60:] = 100
+        summaries = statistics.summarize_by_year(np.array([2000, 2001]), probability)
+        self.assertEqual([x["year"] for x in summaries], [2000])
+        self.assertAlmostEqual(summaries[0]["life_expectancy"], 60.5)
+        self.assertEqual(summaries[0]["modal_age_at_death"], 60)
+
+    def test_compare_pairwise(self):
+        curves = np.array([[1.0, 0.5], [1.0, 0.25], [0.5, 0.0]])
+        pairs, differences = statistics.compare_pairwise(curves, "difference")
+        self.assertEqual(pairs.tolist(), [[0, 1], [0, 2], [1, 2]])
+        self.assertEqual(differences.tolist(), [[0.0, 0.25], [0.5, 0.5], [0.5, 0.25]])
+        _, ratios = statistics.compare_pairwise(curves, "ratio")
+        self.assertEqual(ratios[0].tolist(), [1.0, 2.0])
+        self.assertTrue(np.isinf(ratios[1, 1]))
+        self.assertEqual(statistics.compare_pairwise(curves[:1], "ratio")[1].shape, (0, 2))
+
+
+class SerializerTests(SimpleTestCase):
+    def test_life_table(self):
+        """Probabilities should be sent as numbers, leaving out ages without a row and the open age interval"""
+        probability = np.array([0.1234567, np.nan, 0.5, 1.0], dtype=np.float32)
+        cumulative = np.array([1.0, np.nan, 0.25, 0.0], dtype=np.float32)
+        body = serializers.serialize_life_table(probability, cumulative)
+        self.assertEqual(
+            json.loads(body),
+            [
+                {"age": 0, "probability": 0.12346, "cumulative_probability": 1.0},
+                {"age": 2, "probability": 0.5, "cumulative_probability": 0.25},
+            ],
+        )
+
+    def test_matrix(self):
+        body = serializers.serialize_matrix(np.array([[0.5, np.nan], [1.0, 0.123456]], dtype=np.float32))
+        self.assertEqual(json.loads(body), [0.5, None, 1.0, 0.12346])
+
+    def test_life_tables(self):
+        """Tables should be spliced in as they are, with missing ones sent as empty lists"""
+        body = serializers.serialize_life_tables([("Sweden", "f", 2000, b'[{"age":0}]'), ("Norway", "m", 2001, None)])
+        self.assertEqual(
+            json.loads(body),
+            [
+                {"country": "Sweden", "sex": "f", "year": 2000, "table": [{"age": 0}]},
+                {"country": "Norway", "sex": "m", "year": 2001, "table": []},
+            ],
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ViewTests(SimpleTestCase):
+    """Views answer from the make_store() fixture, through the business layer and its cache"""
+
+    def setUp(self):
+        cache.clear()
+        patch_store(self, make_store())
+
+    @staticmethod
+    def get(view, query: str):
+        return view(RequestFactory().get(f"/?{query}"))
+
+    def test_life_tables(self):
+        response = self.get(views.get_life_tables, "country=Sweden&sex=f&year=2002&country=Norway&sex=male&year=2001")
+        self.assertEqual(response.status_code, 200)
+        tables = json.loads(response.content)
+        self.assertEqual(
+            [(x["country"], x["sex"], x["year"], len(x["table"])) for x in tables], [("Sweden", "f", 2002, 3), ("Norway", "m", 2001, 0)]
+        )
+
+    def test_life_tables_bad_request(self):
+        """Each table needs a country, a sex and an integer year, and batches are bounded"""
+        self.assertEqual(self.get(views.get_life_tables, "country=Sweden&sex=f&year=2002&country=Norway").status_code, 400)
+        self.assertEqual(self.get(views.get_life_tables, "country=Sweden&sex=f&year=last").status_code, 400)
+        with mock.patch.object(business, "MAX_BATCH_SIZE", 1):
+            self.assertEqual(self.get(views.get_life_tables, "country=Sweden&sex=f&year=2002&country=Sweden&sex=f&year=2000").status_code, 400)
+
+    def test_lexis_surface(self):
+        surface = json.loads(self.get(views.get_lexis_surface, "country=Sweden&sex=f&column=probability").content)
+        self.assertEqual((surface["first_year"], surface["shape"]), (2000, [3, AGE_COUNT - 1]))
+        self.assertEqual(surface["values"][0], 0.25)
+        self.assertIsNone(surface["values"][AGE_COUNT - 1])  # 2001 has no female table
+
+    def test_lexis_surface_f32(self):
+        """The raw matrix should come with the headers needed to read it"""
+        response = self.get(views.get_lexis_surface, "country=Sweden&sex=f&format=f32")
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual((response["X-First-Year"], response["X-Shape"]), ("2000", f"3,{AGE_COUNT - 1}"))
+        values = np.frombuffer(response.content, dtype="<f4")
+        self.assertEqual((len(values), values[0]), (3 * (AGE_COUNT - 1), 0.25))
+        missing = self.get(views.get_lexis_surface, "country=Norway&sex=f&format=f32")
+        self.assertEqual((missing["X-First-Year"], missing["X-Shape"], missing.content), ("", f"0,{AGE_COUNT - 1}", b""))
+
+    def test_lexis_surface_bad_column(self):
+        self.assertEqual(self.get(views.get_lexis_surface, "country=Sweden&sex=f&column=mx").status_code, 400)
+
+    def test_comparison(self):
+        comparison = json.loads(self.get(views.get_lifetable_comparison, "country=Sweden&country=Norway&sex=f&year=2002").content)
+        self.assertEqual((comparison["countries"], comparison["missing"], comparison["comparisons"]), (["Sweden"], ["Norway"], []))
+        self.assertEqual(comparison["curves"][0][:3], [1.0, 1.0, 1.0])
+
+    def test_comparison_key(self):
+        """Country order and duplicates shouldn't matter, so equal comparisons share one cache entry"""
+        with mock.patch.object(business, "compare_pairwise", wraps=statistics.compare_pairwise) as compare:
+            self.get(views.get_lifetable_comparison, "country=Sweden&country=Norway&sex=f&year=2002")
+            self.get(views.get_lifetable_comparison, "country=Norway&country=Sweden&country=Sweden&sex=f&year=2002")
+        self.assertEqual(compare.call_count, 1)
+
+    def test_comparison_bad_request(self):
+        for query in [
+            "sex=f&year=2002",
+            "country=Sweden&sex=f&year=last",
+            "country=Sweden&sex=f&year=2002&column=mx",
+            "country=Sweden&sex=f&year=2002&measure=sum",
+        ]:
+            self.assertEqual(self.get(views.get_lifetable_comparison, query).status_code, 400, query)
+        with mock.patch.object(business, "MAX_COMPARISON_SIZE", 1):
+            self.assertEqual(self.get(views.get_lifetable_comparison, "country=Sweden&country=Norway&sex=f&year=2002").status_code, 400)
+
+    def test_bootstrap(self):
+        bootstrap = json.loads(self.get(views.get_bootstrap, "").content)
+        self.assertEqual(bootstrap["countries"][1], {"id": 1, "name": "Sweden", "years": {"f": [2002, 2000], "m": [2001]}})
+        self.assertEqual(
+            {key: bootstrap["default"][key] for key in ("country", "sex", "year")}, {"country": "Sweden", "sex": "f", "year": 2002}
+        )
+        self.assertEqual(len(bootstrap["default"]["table"]), 3)
+
+    def test_bootstrap_default(self):
+        """Without a table of the default country, the first country with one is shown, and without any, nothing"""
+        with mock.patch.object(business, "DEFAULT_COUNTRY", "Atlantis"):
+            self.assertEqual(json.loads(self.get(views.get_bootstrap, "").content)["default"]["country"], "Sweden")
+        cache.clear()
+        with mock.patch.object(business, "DEFAULT_SEX", "a"):
+            self.assertIsNone(json.loads(self.get(views.get_bootstrap, "").content)["default"])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class WarmTasksTests(TestCase):
+    """A TestCase, as some warmed responses (availability, summaries) are read from the database"""
+
+    def setUp(self):
+        cache.clear()
+        patch_store(self, make_store())
+
+    def test_warmed_keys_are_read(self):
+        """The keys `manage.py warm_cache` writes should be the ones the views read, so warmed responses are never recomputed"""
+        for function, params in business.get_warm_tasks():
+            function.warm(**params)
+        requests = [
+            (views.get_countries, ""),
+            (views.get_lifetable_availability, ""),
+            (views.get_bootstrap, ""),
+            (views.get_lifetable_years, "country=Sweden"),
+            (views.get_life_table, "country=Sweden&sex=female&year=2002"),
+            (views.get_lexis_surface, "country=Sweden&sex=m&column=cumulative_probability"),
+            (views.get_lifetable_summaries, "country=Norway"),
+            (views.get_lifetable_summaries, "year=2001"),
+        ]
+        with mock.patch("util.decorators.refresh") as refresh:
+            for view, query in requests:
+                self.assertEqual(ViewTests.get(view, query).status_code, 200, query)
+        refresh.assert_not_called()
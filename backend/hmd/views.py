@@ -1,11 +1,13 @@
-import string
-
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
-from django.core.cache import cache
-from django.core.cache.utils import make_template_fragment_key
 from django.conf import settings
-from hmd.models import *
+import hmd.business as business
+from hmd.serializers import serialize
+from hmd.statistics import COMPARISON_MEASURES
+from hmd.store import SURFACE_COLUMNS
+from util.decorators import cacheable_view
+from util.helpers import get_params, is_int
+from util.responses import make_payload, payload_response
 
 
 def add_access_control_headers(resp):
@@ -14,57 +16,120 @@ def add_access_control_headers(resp):
         response["Access-Control-Allow-Origin"] = "*"
     else:
         response["Access-Control-Allow-Origin"] = "medistat.online"
-    response["Access-Control-Allow-Methods"] = "POST"
+    response["Access-Control-Allow-Methods"] = "GET, POST"
     response["Access-Control-Max-Age"] = "1000"
     response["Access-Control-Allow-Headers"] = "X-Requested-With, Content-Type"
     return response
 
 
 @csrf_exempt
-def get_countries(request) -> JsonResponse:
-    key = "countries"
-    result = cache.get(key)
-    if result:
-        return result
+@cacheable_view("lifetables_countries")
+def get_countries(request) -> HttpResponse:
+    payload = business.get_countries()
+    return add_access_control_headers(payload_response(request, payload))
+
+
+@csrf_exempt
+@cacheable_view("lifetables_bootstrap")
+def get_bootstrap(request) -> HttpResponse:
+    payload = business.get_bootstrap()
+    return add_access_control_headers(payload_response(request, payload))
 
-    countries = Country.objects.all().values("id", "name").order_by("name")
-    data = list(countries)
 
-    result = add_access_control_headers(JsonResponse(data, safe=False))
-    cache.set(key, result)
-    return result
+@csrf_exempt
+@cacheable_view("lifetable_years")
+def get_lifetable_years(request) -> HttpResponse:
+    country = get_params(request).get("country")
+    payload = business.get_lifetable_years(country=country)
+    return add_access_control_headers(payload_response(request, payload))
 
 
 @csrf_exempt
-def get_lifetable_years(request) -> JsonResponse:
-    country = request.POST.get("country")
-    cache_key = f"lifetable_country_years"
-    result = cache.get(cache_key)
-    if result:
-        return result
+@cacheable_view("lifetable_availability")
+def get_lifetable_availability(request) -> HttpResponse:
+    payload = business.get_lifetable_availability()
+    return add_access_control_headers(payload_response(request, payload))
+
 
-    years = [x["year"] for x in LifeTable.objects.filter(country__name=country).values("year").distinct().order_by("-year")]
+@csrf_exempt
+@cacheable_view("lifetables")
+def get_life_table(request) -> HttpResponse:
+    params = get_params(request)
+    country = params.get("country")
+    sex = params.get("sex", "").lower()[:1]
+    year = params.get("year")
+
+    payload = business.get_life_table(country=country, sex=sex, year=int(year)) if is_int(year) else make_payload(serialize([]))
+    return add_access_control_headers(payload_response(request, payload))
+
+
+@csrf_exempt
+@cacheable_view("lifetables")
+def get_life_tables(request) -> HttpResponse:
+    # One key per index of the repeated parameters, eg: ?country=Sweden&sex=f&year=2000&country=Norway&sex=m&year=2000
+    params = get_params(request)
+    countries, sexes, years = params.getlist("country"), params.getlist("sex"), params.getlist("year")
+    if not len(countries) == len(sexes) == len(years) or len(countries) > business.MAX_BATCH_SIZE or not all(map(is_int, years)):
+        message = f"Expected up to {business.MAX_BATCH_SIZE} tables, each with a country, a sex and an integer year"
+        return add_access_control_headers(HttpResponseBadRequest(message))
 
-    result = add_access_control_headers(JsonResponse(years, safe=False))
-    cache.set(cache_key, result)
-    return result
+    keys = tuple((country, sex.lower()[:1], int(year)) for country, sex, year in zip(countries, sexes, years))
+    return add_access_control_headers(payload_response(request, business.get_life_tables(keys=keys)))
 
 
 @csrf_exempt
-def get_life_table(request) -> JsonResponse:
-    country = request.POST.get("country")
-    sex = request.POST.get("sex").lower()[0]
-    year = request.POST.get("year")
-    cache_key = f"{country}{year}{sex}".lower()
-    cache_key = "".join([c for c in cache_key if c in string.ascii_lowercase or c in string.digits])  # memcache keys are a little restrictive
-
-    life_table = (
-        LifeTable.objects.filter(country__name=country, year=year, sex=sex, age__lte=109)
-        .order_by("age")
-        .values("age", "probability", "cumulative_probability")
-    )
-    life_table = list(life_table)
-
-    result = add_access_control_headers(JsonResponse(life_table, safe=False))
-    cache.set(cache_key, result)
-    return result
+@cacheable_view("lexis_surface")
+def get_lexis_surface(request) -> HttpResponse:
+    params = get_params(request)
+    country = params.get("country")
+    sex = params.get("sex", "").lower()[:1]
+    column = params.get("column", "probability")
+    if column not in SURFACE_COLUMNS:
+        return add_access_control_headers(HttpResponseBadRequest(f"column should be one of {', '.join(SURFACE_COLUMNS)}"))
+
+    if params.get("format") != "f32":
+        payload = business.get_lexis_surface(country=country, sex=sex, column=column)
+        return add_access_control_headers(payload_response(request, payload))
+
+    # Raw float32 matrix, for clients that draw straight from a typed array. Its layout is sent in headers
+    payload, first_year, shape = business.get_lexis_surface_binary(country, sex, column)
+    response = payload_response(request, payload, content_type="application/octet-stream")
+    response["X-First-Year"] = "" if first_year is None else str(first_year)
+    response["X-Shape"] = ",".join(map(str, shape))
+    response["Access-Control-Expose-Headers"] = "X-First-Year, X-Shape"
+    return add_access_control_headers(response)
+
+
+@csrf_exempt
+@cacheable_view("lifetable_summaries")
+def get_lifetable_summaries(request) -> HttpResponse:
+    params = get_params(request)
+    country = params.get("country") or None
+    year = params.get("year") or None
+    sex = params.get("sex", "").lower()[:1] or None
+    if (country is None and year is None) or (year is not None and not is_int(year)):
+        return add_access_control_headers(HttpResponseBadRequest("Expected a country, an integer year, or both"))
+
+    payload = business.get_lifetable_summaries(country=country, year=None if year is None else int(year), sex=sex)
+    return add_access_control_headers(payload_response(request, payload))
+
+
+@csrf_exempt
+@cacheable_view("lifetable_comparison")
+def get_lifetable_comparison(request) -> HttpResponse:
+    # eg: ?country=Sweden&country=Norway&sex=f&year=2000&column=cumulative_probability&measure=ratio
+    params = get_params(request)
+    countries = tuple(sorted(set(params.getlist("country"))))
+    sex = params.get("sex", "").lower()[:1]
+    year = params.get("year")
+    column = params.get("column", "cumulative_probability")
+    measure = params.get("measure", "difference")
+    if not 0 < len(countries) <= business.MAX_COMPARISON_SIZE or not is_int(year):
+        message = f"Expected between 1 and {business.MAX_COMPARISON_SIZE} countries, and an integer year"
+        return add_access_control_headers(HttpResponseBadRequest(message))
+    if column not in SURFACE_COLUMNS or measure not in COMPARISON_MEASURES:
+        message = f"column should be one of {', '.join(SURFACE_COLUMNS)}, and measure one of {', '.join(COMPARISON_MEASURES)}"
+        return add_access_control_headers(HttpResponseBadRequest(message))
+
+    payload = business.get_comparison(countries=countries, sex=sex, year=int(year), column=column, measure=measure)
+    return add_access_control_headers(payload_response(request, payload))
@@ -64,6 +64,7 @@ INSTALLED_APPS = [
     "hmd",
     "wiki",
     "disease",
+    "util",
 ]
 
 MIDDLEWARE = [
@@ -111,12 +112,37 @@ DATABASES = {
     }
 }
 
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "127.0.0.1:11211",
+# Redis (L2) shared by every process, behind a small LRU in each one (L1). See util.cache_backends
+# Without a Redis password (eg: tests, or running outside compose), each process keeps its own in-memory cache
+if os.environ.get("REDIS_PASSWORD"):
+    CACHES = {
+        "default": {
+            "BACKEND": "util.cache_backends.TieredRedisCache",
+            "LOCATION": f"redis://{os.environ.get('PROJECT_NAME','')}_redis:6379",
+            # Stacks (production, staging, PR previews) share the Redis of their server, so keys are namespaced by stack
+            "KEY_PREFIX": os.environ.get("PROJECT_NAME", ""),
+            "OPTIONS": {
+                "password": os.environ["REDIS_PASSWORD"],
+                "L1_MAX_ENTRIES": 1000,
+                "L1_TIMEOUT": 30,
+                # Seconds between the log lines reporting the hits on each tier, per process
+                "STATS_INTERVAL": 300,
+            },
+        }
     }
-}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "127.0.0.1:11211",
+        }
+    }
+
+# Binary snapshot of every life table, memory-mapped by the hmd views. Written by `manage.py write_lifetable_snapshot`
+LIFETABLE_SNAPSHOT_PATH = os.environ.get("LIFETABLE_SNAPSHOT_PATH", str(BASE_DIR / "data" / "lifetables.snapshot"))
+
+# Static, pre-compressed copy of the read-only API, served by Apache at /static_api/. Written by `manage.py export_static_api`
+STATIC_API_PATH = os.environ.get("STATIC_API_PATH", str(BASE_DIR / "data" / "static_api"))
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
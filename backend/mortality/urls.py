@@ -23,6 +23,12 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("diseases/", wiki_views.disease_index),
     path("lifetables/", hmd_views.get_life_table),
+    path("lifetables_batch/", hmd_views.get_life_tables),
     path("lifetable_years/", hmd_views.get_lifetable_years),
+    path("lifetable_availability/", hmd_views.get_lifetable_availability),
     path("lifetables_countries/", hmd_views.get_countries),
+    path("lifetables_bootstrap/", hmd_views.get_bootstrap),
+    path("lexis_surface/", hmd_views.get_lexis_surface),
+    path("lifetable_summaries/", hmd_views.get_lifetable_summaries),
+    path("lifetable_comparison/", hmd_views.get_lifetable_comparison),
 ]
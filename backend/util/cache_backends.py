@@ -0,0 +1,316 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache
+
+"""
+    Two-tier cache backend: a small, bounded LRU in every process (L1), in front of the Redis cache shared by every
+    process (L2). Reads are answered from L1 when they can, so hot keys (eg: the disease list, dataset versions) don't
+    cost a round trip to Redis.
+
+    Every write to a key is published on a Redis pub/sub channel, and each process drops that key from its L1 when the
+    message arrives, so L1 stays coherent with L2. Pub/sub delivery isn't guaranteed, so L1 entries also expire after a
+    few seconds (L1_TIMEOUT), and a process whose subscription drops clears its L1.
+
+    Django makes a cache instance per thread, so the L1, its hit counts and the listener live in a LocalTier, shared by
+    every instance in the process with the same LOCATION and KEY_PREFIX. Each LocalTier logs its hit counts every
+    STATS_INTERVAL seconds.
+
+    L1 holds the cached objects themselves, not copies, so they must be treated as read-only (as every value cached by
+    this repo, eg: util.responses.Payload, is).
+"""
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub channel on which keys to drop from L1 are published, as "<process token> <key>". Prefixed with KEY_PREFIX
+INVALIDATION_CHANNEL = "cache_invalidation"
+# Published instead of a key to clear every L1
+CLEAR_ALL = "*"
+# Keys deleted per UNLINK while clearing
+CLEAR_BATCH_SIZE = 1000
+# Seconds before a listener whose connection dropped subscribes again
+RECONNECT_INTERVAL = 1.0
+# Counts kept by each LocalTier
+STATS = ("l1_hits", "l1_misses", "l2_hits", "l2_misses")
+
+
+class LocalLRU:
+    """Thread-safe LRU of at most `max_entries` values, each expiring at its own time"""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Any, timeout: float) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class LocalTier:
+    """
+    The L1 of one process, with its hit counts and its invalidation listener. Shared by every TieredRedisCache with the
+    same LOCATION and KEY_PREFIX, so by the instance Django makes in each thread
+    """
+
+    def __init__(self, channel: str, max_entries: int, stats_interval: Optional[float]) -> None:
+        self.channel = channel
+        self.l1 = LocalLRU(max_entries)
+        self.stats_interval = stats_interval
+        self.stats = dict.fromkeys(STATS, 0)
+        self.next_report = time.monotonic() + (stats_interval or 0)
+        self.pid: Optional[int] = None
+        self.token = ""  # Identifies this process in the messages it publishes
+        self.lock = threading.Lock()
+
+    def count(self, **increments: int) -> None:
+        """
+        Adds to the hit and miss counts, and logs them every `stats_interval` seconds. Request threads update them
+        concurrently, so under the L1 lock
+        """
+        with self.l1.lock:
+            for name, increment in increments.items():
+                self.stats[name] += increment
+            report = self.stats_interval is not None and time.monotonic() >= self.next_report
+            if report:
+                self.next_report = time.monotonic() + self.stats_interval
+                stats = dict(self.stats, l1_entries=len(self.l1))
+        if report:
+            logger.info("Cache tiers of %s in process %s: %s", self.channel, os.getpid(), stats)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Hit and miss counts of each tier in this process, plus the number of keys in its L1"""
+        with self.l1.lock:
+            return dict(self.stats, l1_entries=len(self.l1))
+
+    def handle_message(self, message: str) -> None:
+        """Drops the key named by an invalidation message from L1, unless this process sent it"""
+        token, _, key = message.partition(" ")
+        if token == self.token:
+            return
+        if key == CLEAR_ALL:
+            self.l1.clear()
+        else:
+            self.l1.delete(key)
+
+    def ensure_listener(self, get_client: Callable[..., Any]) -> None:
+        """Starts this process' invalidation listener, once per process (so again in a forked child)"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # A forked child inherits its parent's L1 and counts, but not its listener, so it can't trust that L1
+            self.l1.clear()
+            with self.l1.lock:
+                self.stats = dict.fromkeys(STATS, 0)
+                self.next_report = time.monotonic() + (self.stats_interval or 0)
+            self.token = uuid.uuid4().hex
+            self.pid = os.getpid()
+            threading.Thread(target=self.listen, args=(get_client,), name="cache-invalidation", daemon=True).start()
+
+    def listen(self, get_client: Callable[..., Any]) -> None:
+        while True:
+            try:
+                pubsub = get_client(None).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    data = message["data"]
+                    self.handle_message(data.decode() if isinstance(data, bytes) else data)
+            except Exception:
+                logger.warning("Cache invalidation listener disconnected", exc_info=True)
+            # Invalidations may have been missed while disconnected
+            self.l1.clear()
+            time.sleep(RECONNECT_INTERVAL)
+
+
+# LocalTier of each (LOCATION, KEY_PREFIX) in this process
+tiers: Dict[Tuple[str, str], LocalTier] = {}
+tiers_lock = threading.Lock()
+
+
+def get_tier(location: str, key_prefix: str, max_entries: int, stats_interval: Optional[float]) -> LocalTier:
+    """The LocalTier of the caches at `location` under `key_prefix`. It's made with the options of the first of them"""
+    with tiers_lock:
+        if (location, key_prefix) not in tiers:
+            channel = f"{key_prefix}:{INVALIDATION_CHANNEL}" if key_prefix else INVALIDATION_CHANNEL
+            tiers[(location, key_prefix)] = LocalTier(channel, max_entries, stats_interval)
+        return tiers[(location, key_prefix)]
+
+
+class TieredRedisCache(RedisCache):
+    """
+    RedisCache with a per-process LRU in front. Several stacks can share one Redis if each sets its own KEY_PREFIX:
+    clear() only deletes the keys under this cache's prefix, and invalidations are only sent to processes using it.
+    Takes the options of RedisCache, plus:
+    - L1_MAX_ENTRIES: most keys held in each process (default 1000)
+    - L1_TIMEOUT: most seconds a key is served from L1 before it's read from Redis again (default 30)
+    - STATS_INTERVAL: seconds between the log lines reporting each process' hit counts (default 300, None for never)
+
+    >>> CACHES = {"default": {"BACKEND": "util.cache_backends.TieredRedisCache", "LOCATION": "redis://redis:6379"}}
+    """
+
+    _missing = object()
+
+    def __init__(self, server: Union[str, List[str]], params: Dict[str, Any]) -> None:
+        options = dict(params.get("OPTIONS", {}))
+        max_entries = int(options.pop("L1_MAX_ENTRIES", 1000))
+        self.l1_timeout = float(options.pop("L1_TIMEOUT", 30))
+        stats_interval = options.pop("STATS_INTERVAL", 300)
+        super().__init__(server, dict(params, OPTIONS=options))
+
+        location = server if isinstance(server, str) else ",".join(server)
+        self.tier = get_tier(location, self.key_prefix, max_entries, stats_interval)
+        self.l1 = self.tier.l1
+
+    # Reads
+
+    def get(self, key: Any, default: Any = None, version: Optional[int] = None) -> Any:
+        self.ensure_listener()
+        key = self.make_and_validate_key(key, version=version)
+        value = self.l1.get(key, self._missing)
+        if value is not self._missing:
+            self.tier.count(l1_hits=1)
+            return value
+
+        value = self._cache.get(key, self._missing)
+        if value is self._missing:
+            self.tier.count(l1_misses=1, l2_misses=1)
+            return default
+        self.tier.count(l1_misses=1, l2_hits=1)
+        self.l1.set(key, value, self.l1_timeout)
+        return value
+
+    def get_many(self, keys: Iterable[Any], version: Optional[int] = None) -> Dict[Any, Any]:
+        self.ensure_listener()
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        result: Dict[str, Any] = {}
+        for key in key_map:
+            value = self.l1.get(key, self._missing)
+            if value is not self._missing:
+                result[key] = value
+        remaining = [key for key in key_map if key not in result]
+        found: Dict[Any, Any] = self._cache.get_many(remaining) if remaining else {}
+        self.tier.count(l1_hits=len(result), l1_misses=len(remaining), l2_hits=len(found), l2_misses=len(remaining) - len(found))
+        for key, value in found.items():
+            self.l1.set(key, value, self.l1_timeout)
+        result.update(found)
+        return {key_map[key]: value for key, value in result.items()}
+
+    # Writes. Each one drops the key from every other process' L1
+
+    def set(self, key: Any, value: Any, timeout: Optional[float] = DEFAULT_TIMEOUT, version: Optional[int] = None) -> None:
+        self.ensure_listener()
+        key = self.make_and_validate_key(key, version=version)
+        # As in RedisCache. RedisCacheClient's stubs only take whole seconds, but Redis takes any
+        self._cache.set(key, value, self.get_backend_timeout(timeout))  # type: ignore[arg-type]
+        self.cache_locally(key, value, timeout)
+        self.publish(key)
+
+    def set_many(self, data: Dict[Any, Any], timeout: Optional[float] = DEFAULT_TIMEOUT, version: Optional[int] = None) -> List[Any]:
+        self.ensure_listener()
+        safe_data: Dict[Any, Any] = {self.make_and_validate_key(key, version=version): value for key, value in data.items()}
+        if safe_data:
+            self._cache.set_many(safe_data, self.get_backend_timeout(timeout))  # type: ignore[arg-type]
+        for key, value in safe_data.items():
+            self.cache_locally(key, value, timeout)
+            self.publish(key)
+        return []
+
+    def delete(self, key: Any, version: Optional[int] = None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        deleted = self._cache.delete(key)
+        self.publish(key)
+        return deleted
+
+    def delete_many(self, keys: Iterable[Any], version: Optional[int] = None) -> None:
+        safe_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if safe_keys:
+            self._cache.delete_many(safe_keys)
+        for key in safe_keys:
+            self.l1.delete(key)
+            self.publish(key)
+
+    def incr(self, key: Any, delta: int = 1, version: Optional[int] = None) -> int:
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        value = self._cache.incr(key, delta)
+        self.publish(key)
+        return value
+
+    def clear(self) -> bool:  # type: ignore[override]  # As RedisCache.clear(), which the stubs type as BaseCache.clear()
+        """
+        Deletes every key under KEY_PREFIX, unlike RedisCache.clear(), which flushes the whole database (every stack).
+        Keys are found with SCAN and deleted with UNLINK, in batches, so Redis never blocks on one large command
+        """
+        self.l1.clear()
+        client = self._cache.get_client(None, write=True)
+        pattern = f"{self.key_prefix}:*" if self.key_prefix else "*"
+        batch = []
+        for key in client.scan_iter(match=pattern, count=CLEAR_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= CLEAR_BATCH_SIZE:
+                client.unlink(*batch)
+                batch = []
+        if batch:
+            client.unlink(*batch)
+        self.publish(CLEAR_ALL)
+        return True
+
+    # add() and touch() are inherited: neither changes a value another process may hold in its L1
+
+    def cache_locally(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        backend_timeout = self.get_backend_timeout(timeout)
+        l1_timeout = self.l1_timeout if backend_timeout is None else min(backend_timeout, self.l1_timeout)
+        if l1_timeout > 0:
+            self.l1.set(key, value, l1_timeout)
+        else:
+            self.l1.delete(key)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Hit and miss counts of each tier in this process, plus the number of keys in its L1"""
+        return self.tier.get_stats()
+
+    # Invalidation
+
+    def publish(self, key: str) -> None:
+        try:
+            self._cache.get_client(None, write=True).publish(self.tier.channel, f"{self.tier.token} {key}")
+        except Exception:
+            # The write itself went through. Other processes will drop their copy once it expires from L1
+            logger.warning("Could not publish the invalidation of %s", key, exc_info=True)
+
+    def ensure_listener(self) -> None:
+        self.tier.ensure_listener(self._cache.get_client)
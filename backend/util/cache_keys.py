@@ -0,0 +1,75 @@
+import time
+import hashlib
+from typing import Any
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+
+"""
+    Central registry of cache keys. Keys are namespaced by endpoint, by parameter set, and by the version of the dataset
+    the endpoint is computed from. Loading a dataset changes its version, so every key made for the old version stops
+    being read, and ages out of the cache on its own.
+
+    The hmd version is read from the LifeTableStore the responses are computed from, so a process that hasn't mapped a
+    new snapshot yet keeps writing under the old version, and can't cache old tables under the new one.
+"""
+
+HMD = "hmd"
+WIKI = "wiki"
+
+# Endpoint -> dataset its responses are computed from
+ENDPOINTS = {
+    "lifetables": HMD,
+    "lifetables_batch": HMD,
+    "lifetable_years": HMD,
+    "lifetable_availability": HMD,
+    "lifetables_countries": HMD,
+    "lexis_surface": HMD,
+    "lifetable_summaries": HMD,
+    "lifetable_comparison": HMD,
+    "lifetables_bootstrap": HMD,
+    "diseases": WIKI,
+}
+
+
+def make_key(endpoint: str, **params: Any) -> str:
+    """
+    Builds the cache key of one response. Parameters are hashed, so keys stay short and free of characters memcached
+    rejects, whatever users send
+    :param endpoint: key of ENDPOINTS
+    :param params: parameters the response depends on
+    :return: eg: `diseases:v3:5d41402abc4b2a76b9719d911017c592`
+    """
+    version = get_dataset_version(ENDPOINTS[endpoint])
+    digest = hashlib.md5(urlencode(sorted(params.items())).encode()).hexdigest()
+    return f"{endpoint}:v{version}:{digest}"
+
+
+def get_dataset_version(dataset: str) -> str:
+    """
+    Returns the current version of a dataset: a generation counter kept in the cache, which flush_cache bumps, followed
+    for hmd by the version of this process' LifeTableStore (a hash of its snapshot). If the counter was never set (or
+    was evicted), it starts from the current time rather than 1, so it can't collide with versions used before it was lost
+    """
+    generation = cache.get_or_set(version_key(dataset), time.time_ns, timeout=None)
+    if dataset == HMD:
+        from hmd.store import get_store  # Imported here, so util can be imported before the hmd models are ready
+
+        return f"{generation}.{get_store().version}"
+    return str(generation)
+
+
+def bump_dataset_version(dataset: str) -> str:
+    """
+    Invalidates every cached response computed from `dataset`. Called by the commands that load wiki data, and by
+    flush_cache. Loading hmd data needs no bump: the store version changes in each process as it maps the new snapshot
+    """
+    try:
+        cache.incr(version_key(dataset))
+    except ValueError:  # Version isn't set
+        pass
+    return get_dataset_version(dataset)
+
+
+def version_key(dataset: str) -> str:
+    return f"dataset_version:{dataset}"
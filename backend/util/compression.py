@@ -0,0 +1,64 @@
+import gzip
+from typing import Dict, Iterable, Optional
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # Optional: without it, bodies are only gzipped
+    brotli = None
+
+"""
+    Pre-compression of response bodies. Bodies of a finite set of responses (eg: one per life table) are compressed once,
+    when they're rendered, at the highest levels, since the cost is paid once per dataset version rather than once per
+    request. Bodies rendered on demand, for combinations of parameters too many to pre-render (eg: batches of tables),
+    are compressed at the fast levels, as their cost is paid in the request that misses the cache.
+"""
+
+GZIP = "gzip"
+BROTLI = "br"
+# File extension of each encoding, for static files
+EXTENSIONS = {GZIP: ".gz", BROTLI: ".br"}
+# Encodings in order of preference, when a client accepts several
+PREFERENCE = [BROTLI, GZIP]
+# Compression level of each encoding: (highest, fast). Fast levels compress several times faster, and only a little worse
+LEVELS = {GZIP: (9, 6), BROTLI: (11, 5)}
+
+
+def available_encodings() -> list:
+    """Encodings this process can produce, in order of preference"""
+    return [encoding for encoding in PREFERENCE if encoding != BROTLI or brotli is not None]
+
+
+def compress(body: bytes, fast: bool = False) -> Dict[str, bytes]:
+    """
+    Compresses a body with every available encoding
+    :param fast: whether to use the fast levels of LEVELS, rather than the highest
+    :return: dict of encoding (as in Content-Encoding) -> compressed body
+    """
+    result = {GZIP: gzip.compress(body, compresslevel=LEVELS[GZIP][fast], mtime=0)}
+    if brotli is not None:
+        result[BROTLI] = brotli.compress(body, quality=LEVELS[BROTLI][fast])
+    return result
+
+
+def choose_encoding(accept_encoding: str, encodings: Iterable[str]) -> Optional[str]:
+    """
+    Picks the preferred encoding a client accepts, among those a body is available in
+    :param accept_encoding: Accept-Encoding header, eg: `gzip, deflate, br;q=0.9`. Encodings with q=0 are refused
+    :param encodings: encodings the body is available in
+    :return: encoding, or None to send the body as it is
+    """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, parameters = item.strip().partition(";")
+        quality = parameters.strip().removeprefix("q=")
+        try:
+            if parameters and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+
+    for encoding in PREFERENCE:
+        if encoding in encodings and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
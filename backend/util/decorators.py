@@ -1,7 +1,119 @@
-from typing import Union, List
+import time
+import uuid
+import functools
+from typing import Any, Callable, Union, List
 
 from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 
-# TODO: View function decorator
+from util.cache_keys import ENDPOINTS, get_dataset_version, make_key
 
-# TODO: Cache Decorator
+# Seconds a cached value is served as fresh
+DEFAULT_TIMEOUT = 60 * 60
+# Seconds after that during which the stale value is still served, while one worker recomputes it
+DEFAULT_STALE_TIMEOUT = 24 * 60 * 60
+# Seconds a worker may hold the recompute lock before it expires (eg: if the worker died)
+LOCK_TIMEOUT = 30
+# How long, and how often, workers without the lock poll for the value on a cold miss
+WAIT_TIMEOUT = 10.0
+POLL_INTERVAL = 0.05
+# Seconds HTTP caches (browsers, the reverse proxy) may serve a GET response without revalidating it
+HTTP_MAX_AGE = 5 * 60
+
+
+def read_through(endpoint: str, timeout: int = DEFAULT_TIMEOUT, stale_timeout: int = DEFAULT_STALE_TIMEOUT) -> Callable:
+    """
+    Caches the result of the decorated function under util.cache_keys.make_key(endpoint, **kwargs), so the function
+    must take keyword arguments only.
+
+    Only one worker recomputes a missing or stale value at a time (single flight). On a cold miss, the others wait
+    for its result. Once a value is stale, the others keep getting the stale value until it's replaced.
+
+    The decorated function gets a `warm(**kwargs)` attribute, which recomputes the value and caches it unconditionally
+    (eg: to fill the cache after a load, see `manage.py warm_cache`).
+
+    >>> @read_through("diseases")
+    ... def get_diseases_payload() -> Payload:
+    ...     ...
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(**params: Any) -> Any:
+            key = make_key(endpoint, **params)
+            lock_key = f"lock:{key}"
+            token = uuid.uuid4().hex  # Identifies this worker's hold on the lock
+
+            entry = cache.get(key)  # (value, time until which it's fresh)
+            if entry is not None:
+                value, fresh_until = entry
+                if time.time() < fresh_until or not cache.add(lock_key, token, LOCK_TIMEOUT):
+                    return value
+                return refresh(key, lock_key, token, function, params, timeout, stale_timeout)
+
+            if cache.add(lock_key, token, LOCK_TIMEOUT):
+                return refresh(key, lock_key, token, function, params, timeout, stale_timeout)
+
+            # Another worker is computing the value, so wait for it rather than repeating its work
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry[0]
+            return function(**params)
+
+        def warm(**params: Any) -> Any:
+            value = function(**params)
+            store(make_key(endpoint, **params), value, timeout, stale_timeout)
+            return value
+
+        wrapper.warm = warm  # type: ignore
+        return wrapper
+
+    return decorator
+
+
+def refresh(key: str, lock_key: str, token: str, function: Callable, params: dict, timeout: int, stale_timeout: int) -> Any:
+    """
+    Computes a value and caches it. Callers must hold the lock at `lock_key`, which is released here. If computing
+    outlived LOCK_TIMEOUT, the lock may belong to another worker by now, so it's only deleted if it still holds `token`
+    """
+    try:
+        value = function(**params)
+        store(key, value, timeout, stale_timeout)
+        return value
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def store(key: str, value: Any, timeout: int, stale_timeout: int) -> None:
+    cache.set(key, (value, time.time() + timeout), timeout + stale_timeout)
+
+
+def cacheable_view(endpoint: str, max_age: int = HTTP_MAX_AGE) -> Callable:
+    """
+    Sets the headers HTTP caches need on the responses of a view. GET responses may be cached publicly for `max_age`
+    seconds, then served stale while they are revalidated with their ETag. Every response carries the version of the
+    dataset it was computed from in `X-Data-Version`. POST responses are left uncacheable, as HTTP makes them
+
+    >>> @cacheable_view("diseases")
+    ... def disease_index(request):
+    ...     ...
+    """
+
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+            response = view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD") and response.status_code in (200, 304):
+                patch_cache_control(response, public=True, max_age=max_age, stale_while_revalidate=DEFAULT_STALE_TIMEOUT)
+            patch_vary_headers(response, ["Accept-Encoding"])
+            response["X-Data-Version"] = str(get_dataset_version(ENDPOINTS[endpoint]))
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,7 @@
 from typing import Union, List
 
+from django.http import HttpRequest, QueryDict
+
 
 def is_float(text: str) -> bool:
     try:
@@ -15,3 +17,8 @@ def is_int(text: str) -> bool:
         return True
     except:
         return False
+
+
+def get_params(request: HttpRequest) -> QueryDict:
+    """Parameters of a request, from the query string of a GET (cacheable) or the form data of a POST"""
+    return request.POST if request.method == "POST" else request.GET
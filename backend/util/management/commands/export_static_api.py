@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+import hmd.business
+import wiki.business
+from hmd.store import get_store
+from util.compression import EXTENSIONS
+from util.processes import fork_pool
+from util.responses import Payload, make_payload
+
+import os
+import glob
+import time
+import shutil
+from typing import Any, Iterator, Tuple, Union
+
+
+def is_file_name(name: str) -> bool:
+    """Whether a parameter (eg: a country name) can be used as a file name as it is"""
+    return "/" not in name and not name.startswith(".")
+
+
+def write_file(root: str, relative_path: str, content: Union[bytes, Payload]) -> int:
+    """
+    Writes one response body, plus a pre-compressed copy for each of its encodings (eg: 2000.json.gz)
+    :param content: a payload, whose compressed bodies are written as they are, or a body, which is compressed here
+    :return: bytes written
+    """
+    payload = content if isinstance(content, Payload) else make_payload(content)
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    encodings = payload.encodings or {}
+    for extension, data in [("", payload.body)] + [(EXTENSIONS[encoding], data) for encoding, data in encodings.items()]:
+        with open(path + extension, "wb") as file:
+            written += file.write(data)
+    return written
+
+
+def write_files(root: str, files: list) -> Tuple[int, int]:
+    """Writes a chunk of (relative path, payload or body), in one worker"""
+    return len(files), sum(write_file(root, relative_path, content) for relative_path, content in files)
+
+
+def publish(root: str, release: str) -> None:
+    """
+    Points `root`, a symlink, at the tree written to `release`. The link is swapped with one rename, so the server sees
+    the old tree or the new one, and never a missing or half-written one. Older trees (eg: the previous one, or those of
+    failed runs) are deleted afterwards. Newer ones are kept, as another export may still be writing them
+    :param release: `root`, suffixed with the time its export started, in nanoseconds
+    """
+    if os.path.isdir(root) and not os.path.islink(root):
+        # Exported before trees were published through a link. Moved aside once, the only time root is briefly missing
+        os.rename(root, f"{root}-unlinked")
+    link = f"{root}.link"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(release), link)
+    os.replace(link, root)
+
+    started = int(release[len(root) + 1 :])
+    for path in glob.glob(f"{glob.escape(root)}-*"):
+        suffix = path[len(root) + 1 :]
+        if suffix == "unlinked" or (suffix.isdigit() and int(suffix) < started):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders every response of lifetables/, lifetable_years/, lifetables_countries/ and diseases/ into a tree of "
+        "static, pre-compressed files, addressed by parameter (eg: lifetables/Sweden/f/2000.json). Apache serves the "
+        "tree at /static_api/ without going through Django. Trees are published through a symlink, which is swapped "
+        "atomically once the new tree is complete"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--path", default=settings.STATIC_API_PATH, help="Destination folder")
+        parser.add_argument("--workers", type=int, default=4, help="Number of processes compressing and writing files")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+
+        start = time.perf_counter()
+        root = os.path.abspath(options["path"])
+        release = f"{root}-{time.time_ns()}"
+
+        files = list(self.render())
+        chunks = [files[i : i + 100] for i in range(0, len(files), 100)]
+        if workers == 1:
+            results = [write_files(release, chunk) for chunk in chunks]
+        else:
+            with fork_pool(workers) as pool:
+                results = list(pool.map(write_files, [release] * len(chunks), chunks))
+        publish(root, release)
+
+        count, size = sum(x[0] for x in results), sum(x[1] for x in results)
+        self.stdout.write(
+            f"Wrote {count} responses ({size / 1e6:.1f} MB with compressed copies) to {root} in {time.perf_counter() - start:.1f}s"
+        )
+
+    @staticmethod
+    def render() -> Iterator[Tuple[str, Union[bytes, Payload]]]:
+        """
+        Renders every response, as (path relative to the tree, payload or body). Responses are computed, not read from
+        the cache. Life tables are pre-rendered in the store, so their bodies are yielded, and compressed by the workers
+        """
+        store = get_store()
+        yield "lifetables_countries/index.json", hmd.business.get_countries.__wrapped__()  # type: ignore
+        yield "diseases/index.json", wiki.business.get_diseases_payload.__wrapped__()  # type: ignore
+
+        for _, country in store.countries:
+            if is_file_name(country):
+                yield f"lifetable_years/{country}.json", hmd.business.get_lifetable_years.__wrapped__(country=country)  # type: ignore
+
+        for country_index, sex_index, year_offset in zip(*store.available.nonzero()):
+            country, sex, year = store.countries[country_index][1], store.sexes[sex_index], store.first_year + int(year_offset)
+            if is_file_name(country):
+                yield f"lifetables/{country}/{sex}/{year}.json", store.get_payload(country, sex, year)
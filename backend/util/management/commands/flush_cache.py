@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandParser
+from util.cache_keys import ENDPOINTS, bump_dataset_version
+
+import time
+from typing import Any
+
+
+class Command(BaseCommand):
+    help = "Flushes the cache of this stack only. Other stacks sharing its Redis keep theirs"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--dataset",
+            choices=sorted(set(ENDPOINTS.values())),
+            help="Only invalidate the responses computed from this dataset, by bumping its version. Old keys age out on their own",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        start = time.perf_counter()
+        if options["dataset"]:
+            version = bump_dataset_version(options["dataset"])
+            self.stdout.write(f"Bumped {options['dataset']} to version {version}")
+        else:
+            cache.clear()
+            self.stdout.write(f"Cleared the cache in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+import hmd.business
+import wiki.business
+from util.processes import fork_pool
+
+import time
+from collections import Counter
+from concurrent.futures import as_completed
+from typing import Any, Callable, List, Tuple
+
+
+def warm(function: Callable, params: dict) -> str:
+    """Computes one response and writes it to the cache"""
+    function.warm(**params)  # type: ignore
+    return function.__name__
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes every cached API response for the current dataset versions, and writes it to the cache, so the first "
+        "visitors after a load or a flush don't pay for it. Only useful with a shared cache (Redis), not LocMemCache"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--workers", type=int, default=4, help="Number of processes computing responses")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+
+        start = time.perf_counter()
+        tasks = hmd.business.get_warm_tasks() + wiki.business.get_warm_tasks()
+        if workers == 1:
+            written, failed = self.warm_in_sequence(tasks)
+        else:
+            written, failed = self.warm_in_parallel(tasks, workers)
+
+        for name, count in sorted(Counter(written).items()):
+            self.stdout.write(f"{name:<28} {count:>6} keys")
+        self.stdout.write(f"Wrote {len(written)} keys in {time.perf_counter() - start:.1f}s")
+        if failed:
+            raise CommandError(f"{failed} of {len(tasks)} keys could not be computed")
+
+    def warm_in_sequence(self, tasks: List[Tuple[Callable, dict]]) -> Tuple[List[str], int]:
+        """Warms every task in this process. A failing task is reported, and the others still run"""
+        written, failed = [], 0
+        for function, params in tasks:
+            try:
+                written.append(warm(function, params))
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{type(e).__name__} - {e}")
+        return written, failed
+
+    def warm_in_parallel(self, tasks: List[Tuple[Callable, dict]], workers: int) -> Tuple[List[str], int]:
+        """Same as warm_in_sequence, with the tasks spread over a process pool"""
+        written, failed = [], 0
+        with fork_pool(workers) as pool:
+            futures = [pool.submit(warm, function, params) for function, params in tasks]
+            for future in as_completed(futures):
+                try:
+                    written.append(future.result())
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{type(e).__name__} - {e}")
+        return written, failed
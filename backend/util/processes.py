@@ -0,0 +1,15 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+
+
+def fork_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for management commands that spread work over several processes. Workers are forked, so they start
+    with the caller's state (settings, loaded data) rather than pickling it. The caller's database connections are
+    closed first, as a connection used from several processes corrupts its protocol state: each process opens its own
+    :param workers: number of worker processes
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
@@ -0,0 +1,68 @@
+import hashlib
+from typing import Dict, NamedTuple, Optional
+
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from util.compression import choose_encoding, compress
+
+"""
+    Responses built from cached payloads. Only the serialized body and its ETag are cached (plain bytes and str, which
+    any cache backend can store), and every request gets a fresh, lightweight HttpResponse built around them.
+
+    Payloads also hold their body compressed in advance, so clients get the encoding they accept at no CPU cost.
+"""
+
+# Bodies smaller than this are sent as they are. Compressing them saves less than it costs
+MIN_COMPRESSED_SIZE = 512
+
+
+class Payload(NamedTuple):
+    body: bytes
+    etag: str  # Quoted strong ETag, eg: `"5d41402abc4b2a76b9719d911017c592"`
+    encodings: Optional[Dict[str, bytes]] = None  # Content-Encoding -> compressed body
+
+
+def make_payload(body: bytes, compressed: bool = True, fast: bool = False) -> Payload:
+    """
+    Pairs a serialized body with an ETag hashed from its content, so equal bodies always get equal ETags
+    :param compressed: whether to compress the body with every available encoding, when it's large enough. Leave it
+    on for payloads that are cached, so the cost is paid once
+    :param fast: whether to compress at the fast levels. Set it for payloads of unbounded parameter sets (eg: batches),
+    which are rendered in the request path, and may never be requested again
+    """
+    encodings = compress(body, fast) if compressed and len(body) >= MIN_COMPRESSED_SIZE else None
+    return Payload(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', encodings)
+
+
+def payload_response(request: HttpRequest, payload: Payload, content_type: str = "application/json") -> HttpResponse:
+    """
+    Responds with the payload, or with a 304 Not Modified if the client already holds it. The body is sent in the
+    preferred encoding the client accepts, if the payload has one. Each encoding is a representation of its own, with
+    its own ETag (eg: `"5d41...592-br"`)
+    :param request: its Accept-Encoding header picks the encoding, and its If-None-Match header is compared to the ETag
+    :param payload: body, ETag and compressed bodies
+    :param content_type: of the body
+    """
+    encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""), payload.encodings or {})
+    etag = payload.etag if encoding is None else f'{payload.etag[:-1]}-{encoding}"'
+
+    response: HttpResponse
+    if etag_matches(request.META.get("HTTP_IF_NONE_MATCH", ""), etag):
+        response = HttpResponseNotModified()
+    else:
+        body = payload.body if encoding is None else payload.encodings[encoding]  # type: ignore
+        response = HttpResponse(body, content_type=content_type)
+    response["ETag"] = etag
+    if encoding is not None:
+        response["Content-Encoding"] = encoding
+    if payload.encodings:
+        patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so `W/"x"` matches `"x"`"""
+    etags = parse_etags(if_none_match)
+    return "*" in etags or any(x.removeprefix("W/") == etag for x in etags)
@@ -1,3 +1,419 @@
-from django.test import TestCase
+import os
+import gzip
+import fnmatch
+import tempfile
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from util import cache_backends
+from util import compression
+from util import cache_keys  # System under test
+from util import decorators
+from util import responses
+from util.management.commands import export_static_api
+
+
+# Tests that clear and write the cache get one of their own, never the stack's Redis (which CI's container has)
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "util-tests"}}
+# Stands in for the LifeTableStore hmd keys are versioned by, so tests don't read life tables
+STORE = SimpleNamespace(version="5d41402abc4b2a76")
+
+
+@mock.patch("hmd.store.get_store", lambda: STORE)
+@override_settings(CACHES=LOCAL_CACHES)
+class CacheKeyTests(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_parameters(self) -> None:
+        """Keys should depend on every parameter, but not on their order"""
+        key = cache_keys.make_key("lifetables", country="Sweden", sex="f", year="2000")
+        self.assertEqual(key, cache_keys.make_key("lifetables", year="2000", sex="f", country="Sweden"))
+        self.assertNotEqual(key, cache_keys.make_key("lifetables", country="Sweden", sex="m", year="2000"))
+        self.assertNotEqual(key, cache_keys.make_key("lifetable_years", country="Sweden", sex="f", year="2000"))
+
+    def test_memcache_safe(self) -> None:
+        """Keys shouldn't contain spaces or control characters, whatever the parameters"""
+        key = cache_keys.make_key("lifetable_years", country="Bosnia & Herzegovina\n")
+        self.assertTrue(key.isprintable())
+        self.assertNotIn(" ", key)
+
+    def test_bump_dataset_version(self) -> None:
+        """Bumping a dataset should change the keys of its endpoints only"""
+        hmd_key = cache_keys.make_key("lifetables_countries")
+        wiki_key = cache_keys.make_key("diseases")
+        cache_keys.bump_dataset_version(cache_keys.HMD)
+        self.assertNotEqual(hmd_key, cache_keys.make_key("lifetables_countries"))
+        self.assertEqual(wiki_key, cache_keys.make_key("diseases"))
+
+    def test_store_version(self) -> None:
+        """hmd keys should follow the store of the process that makes them, so old tables never get new keys"""
+        key = cache_keys.make_key("lifetables_countries")
+        with mock.patch("hmd.store.get_store", lambda: SimpleNamespace(version="7d793037a0760186")):
+            self.assertNotEqual(key, cache_keys.make_key("lifetables_countries"))
+        self.assertEqual(key, cache_keys.make_key("lifetables_countries"))
+
+
+@mock.patch("hmd.store.get_store", lambda: STORE)
+@override_settings(CACHES=LOCAL_CACHES)
+class ReadThroughTests(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.calls = 0
+
+    def make_function(self, timeout: int) -> Any:  # The decorated function, with its `warm` attribute
+        @decorators.read_through("lifetable_years", timeout=timeout)
+        def compute(country: str) -> list:
+            self.calls += 1
+            return [country, self.calls]
+
+        return compute
+
+    def lock(self, **params: Any) -> None:
+        cache.add(f"lock:{cache_keys.make_key('lifetable_years', **params)}", True)
+
+    def test_hit(self) -> None:
+        compute = self.make_function(timeout=60)
+        self.assertEqual(compute(country="Sweden"), ["Sweden", 1])
+        self.assertEqual(compute(country="Sweden"), ["Sweden", 1])
+        self.assertEqual(compute(country="Norway"), ["Norway", 2])
+
+    def test_stale_refresh(self) -> None:
+        """A stale value should be recomputed by the worker that takes the lock"""
+        compute = self.make_function(timeout=0)
+        compute(country="Sweden")
+        self.assertEqual(compute(country="Sweden"), ["Sweden", 2])
+
+    def test_stale_while_revalidate(self) -> None:
+        """While another worker holds the lock, the stale value should be served"""
+        compute = self.make_function(timeout=0)
+        compute(country="Sweden")
+        self.lock(country="Sweden")
+        self.assertEqual(compute(country="Sweden"), ["Sweden", 1])
+        self.assertEqual(self.calls, 1)
+
+    @mock.patch.object(decorators, "WAIT_TIMEOUT", 0.2)
+    def test_wait_for_other_worker(self) -> None:
+        """On a cold miss while another worker holds the lock, its result should be used"""
+        compute = self.make_function(timeout=60)
+        self.lock(country="Sweden")
+        key = cache_keys.make_key("lifetable_years", country="Sweden")
+        with mock.patch.object(decorators.time, "sleep", lambda _: cache.set(key, (["Sweden", 0], 0))):
+            self.assertEqual(compute(country="Sweden"), ["Sweden", 0])
+        self.assertEqual(self.calls, 0)
+
+    def test_warm(self) -> None:
+        """Warming should recompute a fresh value, and the next call should be served it"""
+        compute = self.make_function(timeout=60)
+        compute(country="Sweden")
+        self.assertEqual(compute.warm(country="Sweden"), ["Sweden", 2])
+        self.assertEqual(compute(country="Sweden"), ["Sweden", 2])
+
+    def test_lock_taken_over(self) -> None:
+        """A worker whose lock expired while it computed shouldn't release the lock another worker took since"""
+        key = cache_keys.make_key("lifetable_years", country="Sweden")
+
+        @decorators.read_through("lifetable_years", timeout=60)
+        def compute(country: str) -> list:
+            cache.set(f"lock:{key}", "other worker")
+            return [country]
+
+        compute(country="Sweden")
+        self.assertEqual(cache.get(f"lock:{key}"), "other worker")
+
+    @mock.patch.object(decorators, "WAIT_TIMEOUT", 0.05)
+    def test_wait_timeout(self) -> None:
+        """If the worker holding the lock never delivers, the value should be computed anyway"""
+        compute = self.make_function(timeout=60)
+        self.lock(country="Sweden")
+        self.assertEqual(compute(country="Sweden"), ["Sweden", 1])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CacheableViewTests(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.view = decorators.cacheable_view("diseases", max_age=60)(lambda request: HttpResponse(b"[]"))
+
+    def test_get(self) -> None:
+        response = self.view(RequestFactory().get("/diseases/"))
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(response["X-Data-Version"], str(cache_keys.get_dataset_version(cache_keys.WIKI)))
+
+    def test_post(self) -> None:
+        """POST responses should never be marked cacheable"""
+        response = self.view(RequestFactory().post("/diseases/"))
+        self.assertFalse(response.has_header("Cache-Control"))
+        self.assertTrue(response.has_header("X-Data-Version"))
+
+    def test_data_version(self) -> None:
+        """Loading the dataset should change the version sent to clients"""
+        before = self.view(RequestFactory().get("/diseases/"))["X-Data-Version"]
+        cache_keys.bump_dataset_version(cache_keys.WIKI)
+        self.assertNotEqual(before, self.view(RequestFactory().get("/diseases/"))["X-Data-Version"])
+
+
+class PayloadResponseTests(SimpleTestCase):
+    def setUp(self) -> None:
+        self.payload = responses.make_payload(b'["Sweden"]')
+
+    def get(self, **headers: Any) -> HttpResponse:
+        return responses.payload_response(RequestFactory().get("/", **headers), self.payload)
+
+    def test_etag(self) -> None:
+        """ETags should depend on the body only"""
+        self.assertEqual(self.payload.etag, responses.make_payload(b'["Sweden"]').etag)
+        self.assertNotEqual(self.payload.etag, responses.make_payload(b'["Norway"]').etag)
+
+    def test_response(self) -> None:
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'["Sweden"]')
+        self.assertEqual(response["ETag"], self.payload.etag)
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_not_modified(self) -> None:
+        for header in [self.payload.etag, f"W/{self.payload.etag}", f'"other", {self.payload.etag}', "*"]:
+            response = self.get(HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304, header)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response["ETag"], self.payload.etag)
+
+    def test_modified(self) -> None:
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_small_body(self) -> None:
+        """Small bodies aren't worth compressing"""
+        self.assertIsNone(self.payload.encodings)
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_content_encoding(self) -> None:
+        """The compressed body should be sent to clients accepting it, as a representation with its own ETag"""
+        body = b'[{"age":0,"probability":0.00500}]' * 100
+        self.payload = responses.make_payload(body)
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertNotEqual(response["ETag"], self.payload.etag)
+        self.assertEqual(self.get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        identity = self.get(HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(identity.has_header("Content-Encoding"))
+        self.assertEqual(identity.content, body)
+        self.assertEqual(identity["ETag"], self.payload.etag)
+
+
+class FakeRedisClient:
+    """Stands in for RedisCacheClient, holding values in a dict, and delivering messages to `subscribers` at once"""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, Any] = {}
+        self.subscribers: List[cache_backends.LocalTier] = []
+
+    def get(self, key: str, default: Any) -> Any:
+        return self.values.get(key, default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        return {key: self.values[key] for key in keys if key in self.values}
+
+    def set(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        self.values[key] = value
+
+    def delete(self, key: str) -> bool:
+        return self.values.pop(key, None) is not None
+
+    def incr(self, key: str, delta: int) -> int:
+        self.values[key] += delta
+        return self.values[key]
+
+    def get_client(self, key: Optional[str] = None, write: bool = False) -> "FakeRedisClient":
+        return self
+
+    def scan_iter(self, match: str, count: int) -> List[str]:
+        return [key for key in list(self.values) if fnmatch.fnmatchcase(key, match)]
+
+    def unlink(self, *keys: str) -> None:
+        for key in keys:
+            self.values.pop(key, None)
+
+    def publish(self, channel: str, message: str) -> None:
+        for subscriber in self.subscribers:
+            subscriber.handle_message(message)
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self) -> None:
+        # Messages are delivered by FakeRedisClient, so no listener thread is needed. Patched here, not on the class, as
+        # listeners are started by setUp
+        for patcher in (mock.patch.object(cache_backends.LocalTier, "listen"), mock.patch.dict(cache_backends.tiers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Two processes sharing one Redis
+        self.redis = FakeRedisClient()
+        self.caches = [self.make_cache() for _ in range(2)]
+
+    def make_cache(self, key_prefix: str = "medistat", **options: Any) -> cache_backends.TieredRedisCache:
+        """A cache in a process of its own: tiers are shared within a process, so the ones of earlier caches are dropped"""
+        cache_backends.tiers.clear()
+        params = {"KEY_PREFIX": key_prefix, "OPTIONS": {"L1_MAX_ENTRIES": 2, **options}}
+        tiered = cache_backends.TieredRedisCache("redis://localhost:6379", params)
+        tiered.__dict__["_cache"] = self.redis
+        tiered.ensure_listener()
+        self.redis.subscribers.append(tiered.tier)
+        return tiered
+
+    def test_tiers(self) -> None:
+        first, second = self.caches
+        first.set("diseases", [1])
+        self.assertEqual(first.get("diseases"), [1])
+        self.assertEqual(second.get("diseases"), [1])
+        self.assertEqual(second.get("diseases"), [1])
+        self.assertIsNone(second.get("lifetables"))
+        self.assertEqual(first.get_stats(), {"l1_hits": 1, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0, "l1_entries": 1})
+        self.assertEqual(second.get_stats(), {"l1_hits": 1, "l1_misses": 2, "l2_hits": 1, "l2_misses": 1, "l1_entries": 1})
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "util.cache_backends.TieredRedisCache", "LOCATION": "redis://localhost:6379", "KEY_PREFIX": "threads"}}
+    )
+    def test_concurrent_stats(self) -> None:
+        """Django makes a cache per thread: they should share one L1, and its counts shouldn't lose concurrent updates"""
+        instances: List[Any] = []
+
+        def read() -> None:
+            instances.append(caches["default"])
+            for _ in range(1000):
+                caches["default"].get("diseases")
+
+        with mock.patch.object(cache_backends.TieredRedisCache, "_cache", self.redis):
+            caches["default"].set("diseases", [1])
+            threads = [threading.Thread(target=read) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len({id(instance) for instance in instances}), 8)
+        stats = instances[0].get_stats()
+        self.assertEqual((stats["l1_hits"], stats["l1_entries"]), (8000, 1))
+
+    def test_stats_log(self) -> None:
+        tiered = self.make_cache(STATS_INTERVAL=0)
+        with self.assertLogs(cache_backends.logger, "INFO") as logs:
+            tiered.get("diseases")
+        self.assertIn("'l1_misses': 1", logs.output[0])
+
+    def test_invalidation(self) -> None:
+        """A write in one process should drop the key from the L1 of the others, but not from its own"""
+        first, second = self.caches
+        first.set("diseases", [1])
+        second.get("diseases")
+        first.set("diseases", [2])
+        self.assertEqual(second.get("diseases"), [2])
+        second.delete("diseases")
+        self.assertIsNone(first.get("diseases"))
+
+    def test_incr(self) -> None:
+        first, second = self.caches
+        first.set("dataset_version:hmd", 1)
+        second.get("dataset_version:hmd")
+        first.incr("dataset_version:hmd")
+        self.assertEqual(second.get("dataset_version:hmd"), 2)
+
+    def test_clear(self) -> None:
+        """Clearing should only delete the keys of this stack, from Redis and from every L1"""
+        first, second = self.caches
+        other_stack = self.make_cache(key_prefix="medistat_pr44")
+        first.set("diseases", [1])
+        second.get("diseases")
+        other_stack.set("diseases", [2])
+        first.clear()
+        self.assertIsNone(second.get("diseases"))
+        self.assertEqual(other_stack.get("diseases"), [2])
+        self.assertEqual(list(self.redis.values), ["medistat_pr44:1:diseases"])
+
+    def test_lru(self) -> None:
+        """L1 should hold at most L1_MAX_ENTRIES keys, dropping the least recently used"""
+        lru = cache_backends.LocalLRU(2)
+        lru.set("a", 1, 60)
+        lru.set("b", 2, 60)
+        lru.get("a")
+        lru.set("c", 3, 60)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+
+    def test_l1_expiry(self) -> None:
+        lru = cache_backends.LocalLRU(2)
+        lru.set("a", 1, 0)
+        self.assertIsNone(lru.get("a"))
+
+
+class CompressionTests(SimpleTestCase):
+    def test_compress(self) -> None:
+        body = b'[{"age":0,"probability":0.00500}]' * 100
+        for fast in (False, True):
+            compressed = compression.compress(body, fast)
+            self.assertEqual(gzip.decompress(compressed[compression.GZIP]), body)
+            self.assertEqual(set(compressed), set(compression.available_encodings()))
+            if compression.brotli is not None:
+                self.assertEqual(compression.brotli.decompress(compressed[compression.BROTLI]), body)
+
+    def test_choose_encoding(self) -> None:
+        available = [compression.GZIP, compression.BROTLI]
+        self.assertEqual(compression.choose_encoding("gzip, deflate, br", available), compression.BROTLI)
+        self.assertEqual(compression.choose_encoding("gzip, br;q=0", available), compression.GZIP)
+        self.assertEqual(compression.choose_encoding("*", [compression.GZIP]), compression.GZIP)
+        self.assertIsNone(compression.choose_encoding("deflate", available))
+        self.assertIsNone(compression.choose_encoding("", available))
+
+    def test_deterministic(self) -> None:
+        """Compressed copies shouldn't change unless the body does (eg: gzip headers hold no timestamp)"""
+        self.assertEqual(compression.compress(b"[]"), compression.compress(b"[]"))
+
+
+class PublishTests(SimpleTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = os.path.join(directory.name, "static_api")
+
+    def make_release(self, started: int, body: bytes) -> str:
+        release = f"{self.root}-{started}"
+        export_static_api.write_file(release, "diseases/index.json", body)
+        return release
+
+    def read(self) -> bytes:
+        with open(os.path.join(self.root, "diseases/index.json"), "rb") as file:
+            return file.read()
+
+    def test_swap(self) -> None:
+        """Each release should replace the link to the previous one, which is then deleted"""
+        first = self.make_release(1, b"[1]")
+        export_static_api.publish(self.root, first)
+        self.assertEqual((os.readlink(self.root), self.read()), ("static_api-1", b"[1]"))
+        export_static_api.publish(self.root, self.make_release(2, b"[2]"))
+        self.assertEqual((os.readlink(self.root), self.read()), ("static_api-2", b"[2]"))
+        self.assertFalse(os.path.exists(first))
+
+    def test_unlinked(self) -> None:
+        """A tree exported before releases were published through a link should be replaced by one, once"""
+        export_static_api.write_file(self.root, "diseases/index.json", b"[0]")
+        export_static_api.publish(self.root, self.make_release(1, b"[1]"))
+        self.assertTrue(os.path.islink(self.root))
+        self.assertEqual(self.read(), b"[1]")
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.root))), ["static_api", "static_api-1"])
+
+    def test_newer_release_kept(self) -> None:
+        """Only older releases should be deleted: a newer one may still be being written by another export"""
+        older, newer = self.make_release(1, b"[1]"), self.make_release(3, b"[3]")
+        export_static_api.publish(self.root, self.make_release(2, b"[2]"))
+        self.assertEqual(self.read(), b"[2]")
+        self.assertFalse(os.path.exists(older))
+        self.assertTrue(os.path.exists(newer))
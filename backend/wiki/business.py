@@ -1,7 +1,10 @@
 import re
-from typing import Union, List
+import json
+from typing import Callable, List, Tuple, Union
 
-from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from util.decorators import read_through
+from util.responses import Payload, make_payload
 from wiki.query import *
 
 
@@ -241,12 +244,15 @@ def get_diseases_by_symptom(symptom: WikiSymptom) -> List[WikiDisease]:
     return list(symptom.wikidisease_set.all())
 
 
-def get_diseases_list():
-    cache_key = "disease_list"
-    result = cache.get(cache_key)
-    if result:
-        return result
+def get_diseases_list() -> List[dict]:
+    return [x.to_dict() for x in get_nonempty_diseases()]
 
-    result = [x.to_dict() for x in get_nonempty_diseases()]
-    cache.set(cache_key, result)
-    return result
+
+@read_through("diseases")
+def get_diseases_payload() -> Payload:
+    return make_payload(json.dumps(get_diseases_list(), cls=DjangoJSONEncoder).encode())
+
+
+def get_warm_tasks() -> List[Tuple[Callable, dict]]:
+    """Lists the cached wiki responses worth computing before anyone asks for them, as (read_through function, parameters)"""
+    return [(get_diseases_payload, {})]
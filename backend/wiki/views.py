@@ -1,24 +1,26 @@
 from django.shortcuts import render
-from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 
 # Create your views here.
 
 import wiki.business as business
+from util.decorators import cacheable_view
+from util.responses import payload_response
 
 
 @csrf_exempt
+@cacheable_view("diseases")
 def disease_index(request):
-    diseases = business.get_diseases_list()
-    response = JsonResponse(diseases, safe=False)
+    payload = business.get_diseases_payload()
+    response = payload_response(request, payload)
 
     if settings.DEBUG:
         response["Access-Control-Allow-Origin"] = "*"
     else:
         response["Access-Control-Allow-Origin"] = "medistat.online"
 
-    response["Access-Control-Allow-Methods"] = "GET"
+    response["Access-Control-Allow-Methods"] = "GET, POST"
     response["Access-Control-Max-Age"] = "1000"
     response["Access-Control-Allow-Headers"] = "X-Requested-With, Content-Type"
     return response
@@ -1,16 +1,16 @@
-import os
-import redis  # type:ignore
+import sys
+
+from .manage import run_manage_command
 
 """
-    Initializes the database. If a database already exists, it may be dropped and recreated, so that it can be rebuild cleanly.
-"""
+    Flushes the redis cache of the current stack only, through the backend's `manage.py flush_cache`. Keys are
+    namespaced by PROJECT_NAME, so the other stacks sharing the server's redis keep their cache.
 
-EXPECTED_REDIS_CONTAINER_NAME = "redis"
+    Example:
+    >>> python3 manager.py flush_cache
+    >>> python3 manager.py flush_cache --dataset hmd
+"""
 
 
 def run() -> None:
-    client = redis.Redis(  # type:ignore
-        host=f"cache.{os.environ.get('HOST','localhost')}", port="6379", password=f"{os.environ.get('REDIS_PASS','redis_pass')}"
-    )
-
-    client.flushall()
+    exit(run_manage_command(["flush_cache", *sys.argv[1:]]))
@@ -1,4 +1,5 @@
 import os, sys
+from typing import List
 from docker.models.containers import Container
 
 from .common.docker_helpers import get_docker_containers_by_name
@@ -22,15 +23,22 @@ EXPECTED_CONTAINER_NAME = "backend"
 
 
 def run() -> None:
-    args = sys.argv[1:]
+    status_code = run_manage_command(sys.argv[1:])
+    exit(status_code)  # Command exit code is needed for GitHub Actions
+
+
+def run_manage_command(args: List[str]) -> int:
+    """
+    Runs `manage.py` with `args` inside the backend container
+    :return: The exit code of the command
+    """
     load_venv = "source venv-backend/bin/activate"
     cmd = f'python3 manage.py {" ".join(args)}'
     container_id = get_backend_container_id().id
     status_code = os.system(f'docker exec {container_id} /bin/bash -c "{load_venv} && {cmd}"')
 
     # Exit code here has an extra byte of info - gets the actual exit code via bitshifting
-    status_code = os.WEXITSTATUS(status_code)
-    exit(status_code)  # Command exit code is needed for GitHub Actions
+    return os.WEXITSTATUS(status_code)
 
 
 def get_backend_container_id() -> Container:
@@ -0,0 +1,16 @@
+import sys
+
+from .manage import run_manage_command
+
+"""
+    Fills the cache of the current stack with every API response, through the backend's `manage.py warm_cache`.
+    Run it after loading data or flushing the cache, so the first visitors don't pay for cold queries.
+
+    Example:
+    >>> python3 manager.py warm_cache
+    >>> python3 manager.py warm_cache --workers 8
+"""
+
+
+def run() -> None:
+    exit(run_manage_command(["warm_cache", *sys.argv[1:]]))
@@ -23,6 +23,31 @@ export function postRequest(url, data, callback){
     req.send(formData);
 }
 
+export function getRequest(url, data, callback){
+    let req = new XMLHttpRequest();
+    let result = null;
+    let targetURL = getBackendURL() + url;
+    let params = new URLSearchParams(data).toString();
+
+    if(params){
+      targetURL += '?' + params;
+    }
+
+    req.open("GET", targetURL);
+    req.onload = function(){
+      if(req.readyState === 4){
+        if(req.status === 200 ){
+          result = JSON.parse(req.responseText);
+          callback(result);
+        }
+      }
+    };
+    req.onerror = function() {
+      console.error(req.statusText);
+    }
+    req.send();
+}
+
 function getBackendURL(){
   const hostname = window.location.host;
   const protocol = location.protocol;